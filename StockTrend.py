@@ -1,8 +1,15 @@
+import io
 import os
-import pandas as pd
+import pickle
+import polars as pl
+from numba import njit
 import numpy as np
 from pathlib import Path
-import re
+from datetime import datetime
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 
 # ====== 策略參數（可依需求調整）======
 
@@ -14,29 +21,57 @@ PRICE_RECENT_LOW_WINDOW = 10    #10 股價的 60 日最低點必須出現在最
 PRICE_RISING_DAYS = 2           #3 股價在最近 N 天必須連續上漲（代表止跌反彈已啟動）
 RECENT_OSCILLATION_DAYS = 15    #15 檢查最近 N 天三大法人買賣超是否有明顯震盪（用來識別「震盪洗盤」）
 OSCILLATION_MIN_RANGE = 500     #500 震盪幅度門檻：最近 N 天內最大單日買超與最小單日賣超之差需大於 N 張（確保有真實多空拉鋸）
+TAIL_READ_LINES = MIN_DATA_DAYS * 2  # 只讀取最新的 N 行（舊到新的檔案讀尾端、新到舊的檔案讀開頭，保留餘裕給被剔除的異常列），不足時才讀整個檔案
+SCAN_CACHE_FILE = "scan_cache.pkl"   # 上次掃描結果快取：檔案未變動（修改時間、大小相同）且參數相同時直接沿用
+SCAN_CACHE_VERSION = 3               # 快取格式／分析邏輯版本：修改 eval_conditions、load_stock_frame 等分析邏輯時必須加 1，讓舊快取全部失效
 
 # ===================================
 
+@dataclass
+class StockArrays:
+    """單檔股票最近 MIN_DATA_DAYS 天的資料，每個欄位一個 NumPy 陣列（分析時不再經過 DataFrame）"""
+    code: str
+    name: str
+    date: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    foreign_net: np.ndarray
+    fund_net: np.ndarray
+    dealer_net: np.ndarray
+
+
+def to_stock_arrays(df):
+    """從整理好的 DataFrame 取出分析需要的欄位陣列"""
+    recent = df.tail(MIN_DATA_DAYS)
+    return StockArrays(
+        code=str(df['code'][0]),
+        name=df['name'][0],
+        date=recent['date'].to_numpy(),
+        close=recent['close'].to_numpy(),
+        volume=recent['volume'].to_numpy(),
+        foreign_net=recent['foreign_net'].to_numpy(),
+        fund_net=recent['fund_net'].to_numpy(),
+        dealer_net=recent['dealer_net'].to_numpy()
+    )
+
+
 # ================================
 # 🔍 量價形態分析函式
 # ================================
-def analyze_volume_price_pattern(df):
+def analyze_volume_price_pattern(sa):
     """
     基於最新兩筆資料，判斷量價形態。
     回傳 (pattern_name, interpretation)
     """
-    if len(df) < 2:
+    if len(sa.close) < 2:
         return "資料不足", "無法判斷量價形態"
 
-    latest = df.iloc[-1]
-    prev = df.iloc[-2]
-
-    vol_latest = latest['volume']
-    vol_prev = prev['volume']
-    price_latest = latest['close']
-    price_prev = prev['close']
+    vol_latest = sa.volume[-1]
+    vol_prev = sa.volume[-2]
+    price_latest = sa.close[-1]
+    price_prev = sa.close[-2]
 
-    if pd.isna(vol_latest) or pd.isna(vol_prev) or pd.isna(price_latest) or pd.isna(price_prev):
+    if np.isnan(sa.volume[-2:]).any() or np.isnan(sa.close[-2:]).any():
         return "資料無效", "價格或成交量缺失"
 
     # 判斷成交量變化（±10% 閾值）
@@ -73,134 +108,313 @@ def analyze_volume_price_pattern(df):
     return pattern, interp
 
 
-def fix_price_columns(row):
-    """修復因缺少逗號而黏在一起的價格欄位"""
-    if pd.isna(row['open']):
-        return row
-    open_val = str(row['open']).strip()
-    if len(open_val) > 12 and '.' in open_val:
-        prices = re.findall(r'\d+\.\d{1,3}', open_val)
-        if len(prices) >= 4:
-            row['open'] = prices[0]
-            row['high'] = prices[1]
-            row['low'] = prices[2]
-            row['close'] = prices[3]
-        else:
-            row['open'] = np.nan
-    return row
+def fix_price_columns(lf):
+    """修復因缺少逗號而黏在一起的價格欄位（以 Polars 表達式向量化處理）"""
+    open_str = pl.col('open').str.strip_chars()
+    glued = (open_str.str.len_chars() > 12) & open_str.str.contains('.', literal=True)
+    # 逐列取出所有價格，語意等同 re.findall
+    prices = open_str.str.extract_all(r'\d+\.\d{1,3}')
+    enough = prices.list.len() >= 4
+
+    return lf.with_columns(
+        pl.when(glued & enough).then(prices.list.get(0, null_on_oob=True))
+          .when(glued).then(None)
+          .otherwise(pl.col('open')).alias('open'),
+        *[
+            pl.when(glued & enough).then(prices.list.get(i, null_on_oob=True))
+              .otherwise(pl.col(col)).alias(col)
+            for i, col in [(1, 'high'), (2, 'low'), (3, 'close')]
+        ]
+    )
+
+
+@njit(cache=True)
+def eval_conditions(total_net, cum_vals, closes,
+                    recent_bottom_window, min_rebound_amount, rising_check_days,
+                    price_recent_low_window, price_rising_days,
+                    recent_oscillation_days, oscillation_min_range):
+    """
+    策略條件 B/C/D/E 的數值核心（Numba 編譯），每個陣列只掃描一次，並依成本由低到高短路判斷。
+    回傳 (cond_B, cond_C, cond_D, cond_E)
+    """
+    n = len(cum_vals)
+    last_cum = cum_vals[n - 1]
+
+    # 條件 B: 最近3天三大法人皆買超（最便宜，先算；遇到第一個不符合的就停止）
+    cond_B = True
+    for i in range(max(0, n - 3), n):
+        if not total_net[i] > 0:
+            cond_B = False
+            break
+
+    # 條件 C: 近期創新低 + 反彈足夠 + 最近累積淨額連續上升（單次掃描取得最低點與尾段單調性）
+    global_min = cum_vals[0]
+    min_idx = 0
+    last_m_rising = True
+    m_start = n - rising_check_days + 1 if n >= rising_check_days else n
+    for i in range(1, n):
+        v = cum_vals[i]
+        if v < global_min:
+            global_min = v
+            min_idx = i
+        if i >= m_start and not cum_vals[i - 1] <= v:
+            last_m_rising = False
+    recent_bottom = (n - 1 - min_idx) <= recent_bottom_window
+    enough_rebound = (last_cum - global_min) > min_rebound_amount
+    cond_C = recent_bottom and enough_rebound and last_m_rising
+
+    # 條件 D: 股價近期創新低 + 最近幾天股價上漲
+    # 以最低價最後一次出現的位置判斷是否落在近期視窗（整數比較，不對浮點數做 in 搜尋）
+    m = len(closes)
+    low_60 = closes[0]
+    last_low_idx = 0
+    p_start = max(0, m - price_rising_days)
+    price_rising = (m - p_start) >= 2
+    for i in range(1, m):
+        v = closes[i]
+        if v <= low_60:
+            low_60 = v
+            last_low_idx = i
+        if i > p_start and not closes[i - 1] < v:
+            price_rising = False
+    recent_low_occur = (m - 1 - last_low_idx) < price_recent_low_window
+    cond_D = recent_low_occur and price_rising
+
+    # 條件 E: 近期有震盪 + 最近3天買超 + 累積仍為負（B 不成立或累積已轉正時，不必再掃描震盪）
+    cond_E = False
+    if cond_B and last_cum < 0:
+        o_start = max(0, n - recent_oscillation_days)
+        any_positive = False
+        any_negative = False
+        osci_max = total_net[o_start]
+        osci_min = total_net[o_start]
+        for i in range(o_start, n):
+            v = total_net[i]
+            if v > 0:
+                any_positive = True
+            if v < 0:
+                any_negative = True
+            if v > osci_max:
+                osci_max = v
+            if v < osci_min:
+                osci_min = v
+        cond_E = any_positive and any_negative and (osci_max - osci_min) > oscillation_min_range
+
+    return cond_B, cond_C, cond_D, cond_E
+
+
+def read_tail_lines(file_path, n_lines, chunk_size=6144):
+    """
+    從檔案尾端往回讀取最後 n_lines 行（以 6KB 為單位倒著讀）。
+    回傳 (tail_bytes, whole_file)，whole_file 表示已讀到檔案開頭（此時可能包含表頭）
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(0, 2)
+        pos = f.tell()
+        buf = b''
+        # 多讀一個換行：最後一行通常以換行結尾，且最前面一行可能不完整
+        while pos > 0 and buf.count(b'\n') <= n_lines:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+
+    if pos == 0:
+        return buf, True
+    # 捨棄最前面不完整的一行
+    return buf[buf.index(b'\n') + 1:], False
+
+
+def read_head_lines(file_path, n_lines):
+    """
+    讀取檔案最前面 n_lines 行（含表頭）。
+    回傳 (head_bytes, whole_file)，whole_file 表示整個檔案都已讀入
+    """
+    with open(file_path, 'rb') as f:
+        lines = [f.readline() for _ in range(n_lines)]
+        whole_file = f.read(1) == b''
+    return b''.join(lines), whole_file
 
 
-def analyze_stock_file(file_path):
+def first_line_date(lines):
+    """回傳第一個日期欄位可解析的資料列日期（表頭、空行等會略過），都無法解析時回傳 None"""
+    for line in lines:
+        field = line.split(b',', 1)[0].decode('utf-8', errors='ignore').strip().strip('\ufeff"')
+        try:
+            return datetime.strptime(field, '%Y-%m-%d').date()
+        except ValueError:
+            continue
+    return None
+
+
+def load_stock_frame(source, skip_header, sort=True):
+    """以 Polars 讀取 CSV 內容，修復黏在一起的價格欄位、轉型、過濾異常列並依日期排序（sort=False 時保留檔案中的順序）"""
     cols = [
         'date', 'code', 'name', 'volume', 'trades', 'amount',
         'open', 'high', 'low', 'close', 'pe',
         'foreign_net', 'fund_net', 'dealer_net'
     ]
+    # 不會黏在一起的數值欄位直接以 Float64 解析（無法解析的值視為缺值）；
+    # 其餘欄位先以字串讀入（infer_schema_length=0），價格欄位修復後再轉型
+    typed_cols = ['volume', 'pe', 'foreign_net', 'fund_net', 'dealer_net']
+    csv_options = dict(
+        has_header=False,
+        skip_rows=1 if skip_header else 0,
+        new_columns=cols,
+        infer_schema_length=0,
+        schema_overrides={c: pl.Float64 for c in typed_cols},
+        null_values=['--', 'N/A'],
+        ignore_errors=True,
+        truncate_ragged_lines=True
+    )
+    if isinstance(source, bytes):
+        lf = pl.read_csv(io.BytesIO(source), **csv_options).lazy()
+    else:
+        lf = pl.scan_csv(source, **csv_options)
+    lf = fix_price_columns(lf)
+
+    price_cols = ['open', 'high', 'low', 'close']
+    required_cols = ['open', 'high', 'low', 'close', 'foreign_net', 'fund_net', 'dealer_net', 'volume']
+    # 數值不完整的列（表頭、空行、被截斷的列）直接略過；日期則嚴格解析，
+    # 數值正常但日期格式不符的列視為錯誤，避免 CSV 日期格式改變時整批資料被悄悄濾掉
+    lf = (
+        lf.with_columns([pl.col(c).cast(pl.Float64, strict=False) for c in price_cols])
+          .drop_nulls(subset=required_cols)
+          .drop_nans(subset=required_cols)
+          .with_columns(pl.col('date').str.to_date('%Y-%m-%d'))
+          .drop_nulls(subset=['date'])
+    )
+    if sort:
+        lf = lf.sort('date')
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            first_line = f.readline().strip()
-            has_header = any(kw in first_line for kw in ['日期', '日 期', '股 票'])
-            if has_header:
-                df = pd.read_csv(file_path, skiprows=1, header=None, names=cols, dtype=str)
-            else:
-                df = pd.read_csv(file_path, header=None, names=cols, dtype=str)
+        return lf.collect()
+    except pl.exceptions.InvalidOperationError as e:
+        raise ValueError(f"日期欄位含無法解析的值（應為 YYYY-MM-DD）: {str(e).splitlines()[0]}") from None
 
-        if df.empty:
-            return None
 
-        df = df.apply(fix_price_columns, axis=1)
+def load_window_frame(source, skip_header, descending):
+    """
+    解析檔案的一段（開頭或尾端），這段的日期必須嚴格依檔案方向排列（不可重複、不可亂序）；
+    回傳依日期遞增排序的 DataFrame，順序不符時回傳 None，由呼叫端改為解析整個檔案
+    """
+    df = load_stock_frame(source, skip_header, sort=False)
+    dates = df['date']
+    if not dates.is_sorted(descending=descending) or dates.n_unique() != len(dates):
+        return None
+    return df.reverse() if descending else df
 
-        numeric_cols = ['open', 'high', 'low', 'close', 'pe', 'foreign_net', 'fund_net', 'dealer_net', 'volume']
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
 
-        df.dropna(subset=['open', 'high', 'low', 'close', 'foreign_net', 'fund_net', 'dealer_net', 'volume'], inplace=True)
-        df = df[df['date'].str.match(r'^\d{4}-\d{2}-\d{2}$', na=False)]
-        df['date'] = pd.to_datetime(df['date'])
-        df.sort_values('date', inplace=True)
-        df.reset_index(drop=True, inplace=True)
+def load_recent_frame(file_path):
+    """
+    策略只用到最近 MIN_DATA_DAYS 天，只解析檔案中最新的一段：
+    比較第一筆與最後一筆資料的日期判斷排序方向，舊到新讀尾端、新到舊讀開頭；
+    方向無法判斷、讀到的這段日期未依序排列（例如事後追加或亂序的資料列）或有效資料不足時，退回解析整個檔案
+    """
+    head_bytes, head_whole = read_head_lines(file_path, TAIL_READ_LINES + 1)
+    first_line = head_bytes.split(b'\n', 1)[0].decode('utf-8').strip()
+    has_header = any(kw in first_line for kw in ['日期', '日 期', '股 票'])
+    if head_whole:
+        return load_stock_frame(head_bytes, has_header)
+
+    tail_bytes, tail_whole = read_tail_lines(file_path, TAIL_READ_LINES)
+    first_date = first_line_date(head_bytes.splitlines())
+    last_date = first_line_date(reversed(tail_bytes.splitlines()))
+
+    df = None
+    if first_date is not None and last_date is not None:
+        if first_date < last_date:
+            df = load_window_frame(tail_bytes, has_header and tail_whole, descending=False)
+        elif first_date > last_date:
+            df = load_window_frame(head_bytes, has_header, descending=True)
+    if df is None or len(df) < MIN_DATA_DAYS:
+        df = load_stock_frame(file_path, has_header)
+    return df
+
+
+def analyze_stock_frame(df):
+    """對整理好的 DataFrame 執行策略判斷，資料不足時回傳 None"""
+    if len(df) < MIN_DATA_DAYS:
+        return None
 
-        if len(df) < MIN_DATA_DAYS:
-            return None
+    # 之後只使用欄位陣列：直接計算三大法人合計與累積淨額
+    sa = to_stock_arrays(df)
+    total_net = sa.foreign_net + sa.fund_net + sa.dealer_net
+    cum_vals = total_net.cumsum()
+
+    cond_B, cond_C, cond_D, cond_E = eval_conditions(
+        total_net, cum_vals, sa.close,
+        RECENT_BOTTOM_WINDOW, MIN_REBOUND_AMOUNT, RISING_CHECK_DAYS,
+        PRICE_RECENT_LOW_WINDOW, PRICE_RISING_DAYS,
+        RECENT_OSCILLATION_DAYS, OSCILLATION_MIN_RANGE
+    )
+
+    all_pass = cond_B and cond_C and cond_D and cond_E
+
+    # 取最新收盤價與日期
+    latest_close = float(sa.close[-1])
+    latest_date = str(sa.date[-1])
+
+    stock_info = {
+        'code': sa.code,
+        'name': sa.name,
+        'cond_B': cond_B,
+        'cond_C': cond_C,
+        'cond_D': cond_D,
+        'cond_E': cond_E,
+        'all_pass': all_pass,
+        'latest_close': latest_close,
+        'latest_date': latest_date,
+        'volume_price_pattern': "未分析",
+        'interpretation': ""
+    }
 
-        recent_data = df.tail(MIN_DATA_DAYS).copy()
-        closes = recent_data['close'].values
+    # 若符合策略，進行量價分析
+    if all_pass:
+        pattern, interp = analyze_volume_price_pattern(sa)
+        stock_info['volume_price_pattern'] = pattern
+        stock_info['interpretation'] = interp
+
+    return stock_info
+
+
+def analyze_stock_file(file_path):
+    """讀取單檔 CSV 並執行策略判斷；讀取或分析失敗時印出錯誤並回傳 None"""
+    return analyze_stock_job(file_path)[0]
 
-        recent_data['total_net'] = (
-            recent_data['foreign_net'] + recent_data['fund_net'] + recent_data['dealer_net']
-        )
-        recent_data['cumulative'] = recent_data['total_net'].cumsum()
-        cum_vals = recent_data['cumulative'].values
-        last_cum = cum_vals[-1]
-
-        # 條件 B: 最近 3 天三大法人皆買超
-        last_3_total = recent_data['total_net'].tail(3)
-        cond_B = (last_3_total > 0).all()
-
-        # 條件 C: 近期創新低 + 反彈足夠 + 最近累積淨額連續上升
-        global_min = np.min(cum_vals)
-        min_idx = np.argmin(cum_vals)
-        days_from_min_to_today = len(cum_vals) - 1 - min_idx
-        recent_bottom = days_from_min_to_today <= RECENT_BOTTOM_WINDOW
-        enough_rebound = (last_cum - global_min) > MIN_REBOUND_AMOUNT
-        last_m_rising = True
-        if len(cum_vals) >= RISING_CHECK_DAYS:
-            last_m = cum_vals[-RISING_CHECK_DAYS:]
-            last_m_rising = all(last_m[i] <= last_m[i+1] for i in range(len(last_m)-1))
-        cond_C = recent_bottom and enough_rebound and last_m_rising
-
-        # 條件 D: 股價近期創新低 + 最近幾天股價上漲
-        low_60 = np.min(closes)
-        recent_low_occur = low_60 in closes[-PRICE_RECENT_LOW_WINDOW:]
-        last_p_prices = closes[-PRICE_RISING_DAYS:]
-        price_rising = (
-            len(last_p_prices) >= 2 and
-            all(last_p_prices[i] < last_p_prices[i+1] for i in range(len(last_p_prices)-1))
-        )
-        cond_D = recent_low_occur and price_rising
-
-        # 條件 E: 近期有震盪 + 最近3天買超 + 累積仍為負
-        osci_period = recent_data['total_net'].tail(RECENT_OSCILLATION_DAYS)
-        osci_vals = osci_period.values
-        has_oscillation = (
-            np.any(osci_vals > 0) and
-            np.any(osci_vals < 0) and
-            (np.max(osci_vals) - np.min(osci_vals)) > OSCILLATION_MIN_RANGE
-        )
-        cumulative_still_negative = last_cum < 0
-        cond_E = has_oscillation and cond_B and cumulative_still_negative
-
-        all_pass = cond_B and cond_C and cond_D and cond_E
-
-        # 取最新收盤價與日期
-        latest_close = df['close'].iloc[-1] if not df.empty else None
-        latest_date = df['date'].iloc[-1].strftime('%Y-%m-%d') if not df.empty else "N/A"
-
-        stock_info = {
-            'code': str(df['code'].iloc[0]),
-            'name': df['name'].iloc[0],
-            'cond_B': cond_B,
-            'cond_C': cond_C,
-            'cond_D': cond_D,
-            'cond_E': cond_E,
-            'all_pass': all_pass,
-            'latest_close': latest_close,
-            'latest_date': latest_date,
-            'volume_price_pattern': "未分析",
-            'interpretation': ""
-        }
-
-        # 若符合策略，進行量價分析
-        if all_pass:
-            pattern, interp = analyze_volume_price_pattern(df)
-            stock_info['volume_price_pattern'] = pattern
-            stock_info['interpretation'] = interp
-
-        return stock_info
 
+def analyze_stock_job(file_path):
+    """
+    同 analyze_stock_file，另外回傳是否成功：(stock_info, ok)。
+    讀取失敗（例如檔案被鎖定或寫到一半）時 ok 為 False，結果不寫入快取，下次掃描會重新分析
+    """
+    try:
+        return analyze_stock_frame(load_recent_frame(file_path)), True
     except Exception as e:
         print(f"處理 {file_path} 時出錯: {e}")
-        return None
+        return None, False
+
+
+def strategy_signature():
+    """目前策略參數的組合；參數改變時，快取中的舊結果全部失效"""
+    return (MIN_DATA_DAYS, RECENT_BOTTOM_WINDOW, MIN_REBOUND_AMOUNT, RISING_CHECK_DAYS,
+            PRICE_RECENT_LOW_WINDOW, PRICE_RISING_DAYS, RECENT_OSCILLATION_DAYS, OSCILLATION_MIN_RANGE)
+
+
+def load_scan_cache():
+    """讀取掃描結果快取 {檔案路徑: (指紋, stock_info)}，讀取失敗時視為沒有快取"""
+    try:
+        with open(SCAN_CACHE_FILE, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return {}
+
+
+def save_scan_cache(cache):
+    try:
+        with open(SCAN_CACHE_FILE, 'wb') as f:
+            pickle.dump(cache, f)
+    except Exception as e:
+        print(f"⚠️ 無法寫入掃描快取 {SCAN_CACHE_FILE}: {e}")
 
 
 def scan_stock_folder(folder_path):
@@ -219,12 +433,52 @@ def scan_stock_folder(folder_path):
         print("⚠️ 資料夾中沒有任何 .csv 檔案！")
         return
 
+    # 以 (快取版本, 修改時間, 檔案大小, 策略參數) 當作指紋，指紋相同的檔案直接沿用上次的分析結果
+    cache = load_scan_cache()
+    params = strategy_signature()
+    fingerprints = {}
+    for file_path in all_csv_files:
+        st = file_path.stat()
+        fingerprints[str(file_path)] = (SCAN_CACHE_VERSION, st.st_mtime_ns, st.st_size, params)
+    miss_files = [p for p in all_csv_files
+                  if cache.get(str(p), (None, None))[0] != fingerprints[str(p)]]
+    if len(miss_files) < total_stocks:
+        print(f"♻️ {total_stocks - len(miss_files)} 檔未變動，沿用上次結果；重新分析 {len(miss_files)} 檔\n")
+
+    # 其餘檔案互相獨立，交給多個行程平行分析。
+    # 同時最多排入 2 倍 CPU 數的工作：前面檔案在計算時，後面檔案的讀取已經開始；
+    # 依提交順序取回結果，輸出順序與逐檔處理相同
     matched_stocks = []
-    for csv_file in all_csv_files:
-        result = analyze_stock_file(csv_file)
-        if result and result['all_pass']:
-            matched_stocks.append(result)
-            print(f"✅ 符合: {result['code']} {result['name']}")
+    new_cache = {}
+    max_workers = os.cpu_count() or 1
+    pending_files = iter(miss_files)
+    # 全部命中快取時不必啟動行程池
+    with ProcessPoolExecutor(max_workers=max_workers) if miss_files else nullcontext() as executor:
+        inflight = deque(
+            executor.submit(analyze_stock_job, file_path)
+            for _, file_path in zip(range(2 * max_workers), pending_files)
+        )
+        for file_path in all_csv_files:
+            key = str(file_path)
+            cached = cache.get(key)
+            if cached is not None and cached[0] == fingerprints[key]:
+                result = cached[1]
+                new_cache[key] = cached
+            else:
+                # 未命中快取的檔案依序提交，因此佇列最前面就是這個檔案的結果
+                result, ok = inflight.popleft().result()
+                next_file = next(pending_files, None)
+                if next_file is not None:
+                    inflight.append(executor.submit(analyze_stock_job, next_file))
+                # 讀取或分析失敗的檔案不寫入快取，下次掃描重新分析
+                if ok:
+                    new_cache[key] = (fingerprints[key], result)
+
+            if result and result['all_pass']:
+                matched_stocks.append(result)
+                print(f"✅ 符合: {result['code']} {result['name']}")
+
+    save_scan_cache(new_cache)
 
     print(f"\n=== 符合「震盪後突發回補 + 股價剛啟動 + 累積仍負」的股票 ===")
     print(f"（參數: 震盪{RECENT_OSCILLATION_DAYS}天, 反彈>{MIN_REBOUND_AMOUNT}張, 股價{PRICE_RECENT_LOW_WINDOW}天內創新低）")
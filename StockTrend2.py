@@ -1,11 +1,29 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import plotly.io as pio
 import os
 import sqlite3
 import json
+import traceback
+from datetime import datetime
+from functools import lru_cache
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from stock_common import (
+    DB_CONNECTIONS, get_db_connection, ensure_indexes,
+    CHART_FONT_FAMILY, CHART_TICK_DAYS, CHART_PAGE_TEMPLATE, ACTION_COLORS, RISK_COLORS, ANALYSIS_BLOCK_TEMPLATE,
+    moving_average, get_chart_base_layout, write_plotlyjs_bundle, chart_to_html,
+    generate_chart_job, finish_chart_job,
+    hot_db_float_values, hot_db_int_values, hot_db_text_values
+)
+
+# 圖表 JSON 序列化改用 orjson（有安裝才啟用，否則維持 plotly 預設）
+try:
+    import orjson
+    pio.json.config.default_engine = 'orjson'
+except ImportError:
+    pass
 
 # ==============================
 # 🔧 【可控制的參數設定】
@@ -24,6 +42,7 @@ FOCUS_STOCKS_CSV = "focus_stocks.csv"  # 追蹤清單檔案
 # 資料庫路徑
 DB_TSE_PATH = "stock_data/stock_tse_all.db"  # 上市股票資料庫
 DB_OTC_PATH = "stock_data/stock_otc_all.db"  # 上櫃股票資料庫
+HOT_DB_PATH = "stock_data/stock_hot.db"       # 篩選結果資料庫
 
 # 爆量參數
 VOL_LOOKBACK = 4           # 回看天數
@@ -33,60 +52,130 @@ MIN_VOLUME_THRESHOLD = 5000  # 最近一天成交量最低門檻（張數）
 # 紅三兵參數
 PRICE_LOOKBACK = 3         # 回看天數
 
+# 資料庫中以文字儲存、可能含千位分隔符的數值欄位
+NUMERIC_COLUMNS = ['開盤價', '最高價', '最低價', '收盤價', '成交張數',
+                   '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']
+
+# stock_hot.db 的寫入連線（兩個階段共用同一條，見 get_hot_db_connection）
+HOT_DB_CONNECTIONS = {}
+
 # ==============================
 # 📊 資料庫讀取函數
 # ==============================
+def clean_numeric(series):
+    """移除千位分隔符逗號並轉為數值；已是數值型態的欄位原樣回傳，不再重複轉換"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    # SQLite 同一欄可能混有數字與字串，逐值轉成字串再去逗號（串列推導式比 .str 存取器快）
+    cleaned = [str(v).replace(',', '') for v in series.to_numpy()]
+    return pd.Series(pd.to_numeric(cleaned, errors='coerce'), index=series.index, name=series.name)
+
+def clean_numeric_columns(df):
+    """於讀取資料庫時將數值欄位轉換一次"""
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = clean_numeric(df[col])
+    return df
+
+def fetch_stock_rows(conn, stock_code):
+    """以游標直接取出單一股票的原始資料列，回傳 (欄位名稱, 資料列)"""
+    cursor = conn.execute("SELECT * FROM stock_data WHERE 股票代碼 = ? AND 日期 IS NOT NULL ORDER BY 日期", (stock_code,))
+    columns = [desc[0] for desc in cursor.description]
+    return columns, cursor.fetchall()
+
+def frame_from_rows(columns, rows):
+    """把資料列轉成 DataFrame，並在讀取層一次完成日期與數值欄位的型別轉換"""
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    # 保留原始日期字串（寫入 stock_hot.db 時，無法解析的日期照原樣寫入）
+    df.attrs['原始日期'] = df['日期']
+    df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
+    return clean_numeric_columns(df)
+
 def read_stock_from_db(stock_code):
-    """從資料庫讀取指定股票的資料"""
+    """
+    從資料庫讀取指定股票的資料
+    同一次執行中同一檔股票會被分析、畫圖、寫入 stock_hot.db 多次讀取，結果由 load_stock_from_db 快取；
+    回傳複本，呼叫端可自由修改
+    """
+    df = load_stock_from_db(stock_code)
+    return None if df is None else df.copy()
+
+@lru_cache(maxsize=4096)
+def load_stock_from_db(stock_code):
+    """實際查詢資料庫（先上市、後上櫃）；回傳的 DataFrame 為共用快取，請勿直接修改"""
     df = None
     
     # 先從上市資料庫查詢
     if Path(DB_TSE_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_TSE_PATH)
-            query = f"SELECT * FROM stock_data WHERE 股票代碼 = '{stock_code}' ORDER BY 日期"
-            df = pd.read_sql_query(query, conn)
-            conn.close()
-            if len(df) > 0:
-                return df
+            columns, rows = fetch_stock_rows(get_db_connection(DB_TSE_PATH), stock_code)
+            if rows:
+                return frame_from_rows(columns, rows)
         except:
             pass
     
     # 如果上市找不到，從上櫃資料庫查詢
     if Path(DB_OTC_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_OTC_PATH)
-            query = f"SELECT * FROM stock_data WHERE 股票代碼 = '{stock_code}' ORDER BY 日期"
-            df = pd.read_sql_query(query, conn)
-            conn.close()
-            if len(df) > 0:
-                return df
+            columns, rows = fetch_stock_rows(get_db_connection(DB_OTC_PATH), stock_code)
+            if rows:
+                return frame_from_rows(columns, rows)
         except:
             pass
     
     return None
 
+def prepare_stock_frame(df):
+    """
+    分析前的資料整理：日期轉換、數值轉換、去除缺值並依股票代碼與日期排序
+    可直接套用在整張資料表上（load_all_stocks 只執行一次），也可用於單檔股票
+    """
+    df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
+    clean_numeric_columns(df)
+    df = df.dropna(subset=['日期', '成交張數', '收盤價'])
+    return df.sort_values(['股票代碼', '日期'], kind='stable').reset_index(drop=True)
+
+def load_all_stocks():
+    """
+    一次讀取上市、上櫃資料庫的全部資料，整理後依股票代碼分組
+    回傳 {股票代碼: DataFrame}，每檔已完成 prepare_stock_frame 的整理；與 read_stock_from_db 相同，上市資料優先
+    """
+    all_stocks = {}
+
+    # 先讀上櫃再讀上市，讓同代碼時由上市資料覆蓋
+    for db_path in [DB_OTC_PATH, DB_TSE_PATH]:
+        if not Path(db_path).exists():
+            continue
+        try:
+            df = pd.read_sql_query("SELECT * FROM stock_data ORDER BY 股票代碼, 日期", get_db_connection(db_path))
+        except:
+            continue
+
+        # 整張表一次完成轉換、過濾與排序，之後各檔直接使用
+        df = prepare_stock_frame(df)
+
+        for code, group in df.groupby('股票代碼', sort=False):
+            all_stocks[str(code)] = group.reset_index(drop=True)
+
+    return all_stocks
+
 def get_all_stock_codes():
     """從資料庫獲取所有股票代碼"""
     codes = set()
     
     if Path(DB_TSE_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_TSE_PATH)
-            cursor = conn.cursor()
+            cursor = get_db_connection(DB_TSE_PATH).cursor()
             cursor.execute("SELECT DISTINCT 股票代碼 FROM stock_data")
             codes.update([str(row[0]) for row in cursor.fetchall()])
-            conn.close()
         except:
             pass
     
     if Path(DB_OTC_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_OTC_PATH)
-            cursor = conn.cursor()
+            cursor = get_db_connection(DB_OTC_PATH).cursor()
             cursor.execute("SELECT DISTINCT 股票代碼 FROM stock_data")
             codes.update([str(row[0]) for row in cursor.fetchall()])
-            conn.close()
         except:
             pass
     
@@ -110,31 +199,39 @@ def analyze_volume_price_pattern(df):
     if len(df) < 10:
         return {'signals': [], 'action': '觀望', 'risk_level': '中', 'summary': '資料不足'}
     
-    # 確保數據類型正確
-    df = df.copy()
-    for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數']:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    # 確保數據類型正確（資料庫讀取時已轉換過，只有非數值欄位才需要處理）
+    cols_to_clean = [col for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數']
+                     if col in df.columns and not pd.api.types.is_numeric_dtype(df[col])]
+    if cols_to_clean:
+        df = df.copy()
+        for col in cols_to_clean:
+            df[col] = clean_numeric(df[col])
     
     signals = []
     action_score = 0  # 正分=看多，負分=看空，0=觀望
     risk_factors = []
     
-    # 取最近資料
-    recent = df.tail(10).copy()
-    latest = recent.iloc[-1]
-    prev_1 = recent.iloc[-2] if len(recent) >= 2 else latest
-    prev_2 = recent.iloc[-3] if len(recent) >= 3 else latest
-    prev_3 = recent.iloc[-4] if len(recent) >= 4 else latest
+    # 取最近資料：需要的欄位一次轉成 float64 NumPy 陣列，之後以整數位置取值（避免逐列 iloc 產生 Series）
+    # 缺值一律是 NaN，而 NaN 的任何大小比較都是 False，因此後面的比較不需要再逐一檢查缺值
+    recent = df.tail(10)
+    n = len(recent)
+    arrs = {col: recent[col].to_numpy(dtype=np.float64) for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數']
+            if col in recent.columns}
+    has_ohlc = all(col in arrs for col in ['開盤價', '最高價', '最低價', '收盤價'])
+    closes = arrs['收盤價']
+    highs_10 = arrs.get('最高價', closes)
+    lows_10 = arrs.get('最低價', closes)
+    latest_close = closes[-1]
+    latest_open = arrs['開盤價'][-1] if '開盤價' in arrs else None
     
     # ===== 1. 高量判斷 =====
     is_high_volume = False
     high_volume_day = 0
     
-    if '成交張數' in recent.columns:
-        last_vol = latest['成交張數']
-        prev_3_vols = recent.iloc[-4:-1]['成交張數'].values if len(recent) >= 4 else []
+    if '成交張數' in arrs:
+        vols_10 = arrs['成交張數']
+        last_vol = vols_10[-1]
+        prev_3_vols = vols_10[-4:-1] if n >= 4 else []
         
         if len(prev_3_vols) > 0 and last_vol > max(prev_3_vols):
             is_high_volume = True
@@ -143,10 +240,10 @@ def analyze_volume_price_pattern(df):
             action_score += 0  # 觀望
         
         # 檢查是否為高量第2-3天
-        if len(recent) >= 5:
+        if n >= 5:
             for i in range(1, 3):
-                day_vol = recent.iloc[-(i+1)]['成交張數']
-                before_vols = recent.iloc[-(i+4):-(i+1)]['成交張數'].values
+                day_vol = vols_10[-(i+1)]
+                before_vols = vols_10[-(i+4):-(i+1)]
                 if len(before_vols) > 0 and day_vol > max(before_vols):
                     high_volume_day = i + 1
                     break
@@ -155,17 +252,18 @@ def analyze_volume_price_pattern(df):
     support_price = None
     resistance_price = None
     
-    if '收盤價' in recent.columns and '開盤價' in recent.columns:
+    if latest_open is not None:
         # 找高量K棒的實體低點作為支撐
         if is_high_volume:
-            support_price = min(latest['開盤價'], latest['收盤價'])
+            support_price = min(latest_open, latest_close)
         
         # 找過往高點作為壓力
-        resistance_price = recent['最高價'].max() if '最高價' in recent.columns else recent['收盤價'].max()
+        # fmax.reduce 與 pandas 的 max 相同會略過 NaN（全部缺值時為 NaN），但不必再經過 Series
+        resistance_price = np.fmax.reduce(highs_10)
         
         # 判斷目前位置
-        current_price = latest['收盤價']
-        if support_price is not None and not pd.isna(support_price) and not pd.isna(current_price):
+        current_price = latest_close
+        if support_price is not None:
             if current_price > support_price:
                 signals.append(f"✓ 在支撐線上方 (支撐:{support_price:.2f})")
                 action_score += 2
@@ -174,19 +272,21 @@ def analyze_volume_price_pattern(df):
                 risk_factors.append("破支撐")
                 action_score -= 5
     
+    above_support = support_price is not None and latest_close > support_price
+    
     # ===== 3. K線型態判斷 =====
     # 紅三兵 / 綠三兵
-    if len(recent) >= 3:
-        last_3_closes = recent.tail(3)['收盤價'].values
-        if all(last_3_closes[i] < last_3_closes[i+1] for i in range(2)):
-            if support_price is not None and not pd.isna(support_price) and not pd.isna(latest['收盤價']) and latest['收盤價'] > support_price:
+    if n >= 3:
+        last_3_closes = closes[-3:]
+        if (np.diff(last_3_closes) > 0).all():
+            if above_support:
                 signals.append("🚀 支撐線上方紅三兵（上車）")
                 action_score += 5
             else:
                 signals.append("📈 紅三兵")
                 action_score += 2
-        elif all(last_3_closes[i] > last_3_closes[i+1] for i in range(2)):
-            if resistance_price and latest['收盤價'] < resistance_price:
+        elif (np.diff(last_3_closes) < 0).all():
+            if resistance_price and latest_close < resistance_price:
                 signals.append("📉 壓力線下方綠三兵（減倉）")
                 action_score -= 4
                 risk_factors.append("綠三兵")
@@ -195,32 +295,33 @@ def analyze_volume_price_pattern(df):
                 action_score -= 2
     
     # 底分型 / 頂分型（簡化判斷：最近3天中間那天最低/最高）
-    if len(recent) >= 3:
-        last_3 = recent.tail(3)
-        lows = last_3['最低價'].values if '最低價' in last_3.columns else last_3['收盤價'].values
-        highs = last_3['最高價'].values if '最高價' in last_3.columns else last_3['收盤價'].values
+    if n >= 3:
+        lows = lows_10[-3:]
+        highs = highs_10[-3:]
         
         # 底分型：第2天最低
         if lows[1] < lows[0] and lows[1] < lows[2]:
-            if support_price is not None and not pd.isna(support_price) and not pd.isna(latest['收盤價']) and latest['收盤價'] > support_price:
+            if above_support:
                 signals.append("🎯 支撐線上方底分型（上車）")
                 action_score += 4
         
         # 頂分型：第2天最高
         if highs[1] > highs[0] and highs[1] > highs[2]:
-            if resistance_price is not None and not pd.isna(resistance_price) and not pd.isna(latest['收盤價']) and latest['收盤價'] < resistance_price:
+            if resistance_price is not None and latest_close < resistance_price:
                 signals.append("⚠️ 壓力線下方頂分型（減倉）")
                 action_score -= 4
                 risk_factors.append("頂分型")
     
     # ===== 4. 影線判斷 =====
-    if '最高價' in latest and '最低價' in latest and '開盤價' in latest and '收盤價' in latest:
-        body_high = max(latest['開盤價'], latest['收盤價'])
-        body_low = min(latest['開盤價'], latest['收盤價'])
-        body_size = abs(latest['收盤價'] - latest['開盤價'])
+    if has_ohlc:
+        latest_high = highs_10[-1]
+        latest_low = lows_10[-1]
+        body_high = max(latest_open, latest_close)
+        body_low = min(latest_open, latest_close)
+        body_size = abs(latest_close - latest_open)
         
-        upper_shadow = latest['最高價'] - body_high
-        lower_shadow = body_low - latest['最低價']
+        upper_shadow = latest_high - body_high
+        lower_shadow = body_low - latest_low
         
         # 上天入地（影線是實體2倍）
         if upper_shadow > body_size * 2 or lower_shadow > body_size * 2:
@@ -239,60 +340,57 @@ def analyze_volume_price_pattern(df):
                 risk_factors.append("非高量下影線")
         
         # 上影線碰壓力
-        if resistance_price and latest['最高價'] >= resistance_price * 0.98:
-            if latest['收盤價'] < body_high:
+        if resistance_price and latest_high >= resistance_price * 0.98:
+            if latest_close < body_high:
                 signals.append("⚠️ 上影線碰壓力過不去（減倉）")
                 action_score -= 3
                 risk_factors.append("遇阻回落")
     
     # ===== 5. 趨勢判斷 =====
     # 連續三天高低點下移 = 下跌趨勢
-    if len(recent) >= 3:
-        last_3 = recent.tail(3)
-        if '最高價' in last_3.columns and '最低價' in last_3.columns:
-            highs = last_3['最高價'].values
-            lows = last_3['最低價'].values
-            
-            if all(highs[i] > highs[i+1] for i in range(2)) and all(lows[i] > lows[i+1] for i in range(2)):
-                signals.append("📉 下跌趨勢確立")
-                action_score -= 3
-                risk_factors.append("下跌趨勢")
+    if n >= 3 and '最高價' in arrs and '最低價' in arrs:
+        highs = highs_10[-3:]
+        lows = lows_10[-3:]
+        
+        if (np.diff(highs) < 0).all() and (np.diff(lows) < 0).all():
+            signals.append("📉 下跌趨勢確立")
+            action_score -= 3
+            risk_factors.append("下跌趨勢")
     
     # ===== 6. 量能型態 =====
-    if '成交張數' in recent.columns and len(recent) >= 4:
-        vols = recent.tail(4)['成交張數'].values
+    if '成交張數' in arrs and n >= 4:
+        vols = arrs['成交張數'][-4:]
         
         # 梯量判斷
-        if all(vols[i] < vols[i+1] for i in range(3)):
+        if (np.diff(vols) > 0).all():
             # 上漲梯量
-            if latest['收盤價'] > prev_3['收盤價']:
+            if latest_close > closes[-4]:
                 signals.append("⚠️ 上漲梯量（風險）")
                 action_score -= 3
                 risk_factors.append("上漲梯量")
-        elif all(vols[i] > vols[i+1] for i in range(3)):
+        elif (np.diff(vols) < 0).all():
             # 下跌梯量（縮量）
-            if latest['收盤價'] < prev_3['收盤價']:
+            if latest_close < closes[-4]:
                 signals.append("💡 下跌梯量（機會）")
                 action_score += 2
         
         # 量大實體小
-        if is_high_volume and '開盤價' in latest and '收盤價' in latest:
-            body_size = abs(latest['收盤價'] - latest['開盤價'])
-            price_range = latest['最高價'] - latest['最低價'] if '最高價' in latest else body_size
+        if is_high_volume and latest_open is not None:
+            body_size = abs(latest_close - latest_open)
+            price_range = highs_10[-1] - lows_10[-1] if '最高價' in arrs else body_size
             if body_size < price_range * 0.3:
                 signals.append("⚠️ 量大實體小（有人跑）")
                 action_score -= 2
                 risk_factors.append("量大實體小")
     
     # ===== 7. 連紅/連綠判斷 =====
-    if len(recent) >= 4 and '開盤價' in recent.columns and '收盤價' in recent.columns:
-        last_4 = recent.tail(4)
-        red_count = sum(last_4['收盤價'] > last_4['開盤價'])
+    if n >= 4 and latest_open is not None:
+        red_count = int((closes[-4:] > arrs['開盤價'][-4:]).sum())
         
         if red_count >= 4:
             # 檢查第5天是否放量收綠
-            if len(recent) >= 5:
-                if latest['收盤價'] < latest['開盤價'] and is_high_volume:
+            if n >= 5:
+                if latest_close < latest_open and is_high_volume:
                     signals.append("🚨 連紅≥4天見綠放量（減倉）")
                     action_score -= 4
                     risk_factors.append("連紅後放量收綠")
@@ -303,8 +401,8 @@ def analyze_volume_price_pattern(df):
             signals.append("📋 高量第1天：觀察為主")
             action_score = 0
         elif high_volume_day in [2, 3]:
-            if support_price is not None and not pd.isna(support_price) and not pd.isna(latest['收盤價']) and not pd.isna(latest['開盤價']) and latest['收盤價'] > support_price:
-                if latest['收盤價'] > latest['開盤價']:
+            if above_support:
+                if latest_close > latest_open:
                     signals.append("✨ 高量第2-3天支撐線上方（陽上陰觀）")
                     action_score += 3
     
@@ -351,6 +449,7 @@ def analyze_volume_price_pattern(df):
 # ==============================
 # 🔧 讀取公司清單（無標題列）
 # ==============================
+@lru_cache(maxsize=1)
 def load_company_lists():
     """
     讀取公司清單，優先順序：
@@ -358,6 +457,8 @@ def load_company_lists():
     2. tse_concept_stocks.csv - 上市概念股資料（代碼、名稱、概念股領域）
     3. otc_company_list.csv - 基礎上櫃公司資料（代碼、名稱）
     4. otc_concept_stocks.csv - 上櫃概念股資料（代碼、名稱、概念股領域）
+
+    結果會被快取，重複呼叫不會再讀取磁碟（請勿修改回傳的字典）
     """
     company_info = {}
 
@@ -448,12 +549,13 @@ def load_company_lists():
 # ==============================
 # 📊 分析單檔股票
 # ==============================
-def analyze_stock(stock_code, vol_lookback=None, vol_multiple=None, min_volume_threshold=None):
+def analyze_stock(stock_code, vol_lookback=None, vol_multiple=None, min_volume_threshold=None, stock_df=None):
     """
     分析單檔股票是否符合條件
     
     參數:
         stock_code: 股票代碼
+        stock_df: 已整理的股票資料（來自 load_all_stocks），None 則從資料庫讀取
         vol_lookback: 爆量回看天數（None則使用全局 VOL_LOOKBACK）
         vol_multiple: 爆量倍數（None則使用全局 VOL_MULTIPLE）
         min_volume_threshold: 最低成交量門檻（None則使用全局 MIN_VOLUME_THRESHOLD）
@@ -464,26 +566,22 @@ def analyze_stock(stock_code, vol_lookback=None, vol_multiple=None, min_volume_t
     min_threshold = min_volume_threshold if min_volume_threshold is not None else MIN_VOLUME_THRESHOLD
     
     try:
-        # 從資料庫讀取資料
-        df = read_stock_from_db(stock_code)
-        if df is None or len(df) == 0:
-            return None
-
-        df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
-        
-        # 移除千位分隔符逗號後再轉換數值
-        for col in ['成交張數', '收盤價', '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-        df.dropna(subset=['日期', '成交張數', '收盤價'], inplace=True)
-        df.sort_values('日期', inplace=True)
-        df.reset_index(drop=True, inplace=True)
+        # 優先使用預先載入且已整理好的資料（只讀不改），否則從資料庫讀取後整理
+        df = stock_df
+        if df is None:
+            df = read_stock_from_db(stock_code)
+            if df is None:
+                return None
+            df = prepare_stock_frame(df)
 
         if len(df) < max(lookback, PRICE_LOOKBACK):
             return None
 
+        # ===== 檢查成交量門檻 =====
+        # 無論是否啟用爆量條件，最近一天成交量都必須達到門檻；這是最便宜的條件，最先檢查
+        if df['成交張數'].iloc[-1] < min_threshold:
+            return None
+
         latest_date = df['日期'].iloc[-1].strftime('%Y-%m-%d')
         latest_close = df['收盤價'].iloc[-1]
 
@@ -499,9 +597,9 @@ def analyze_stock(stock_code, vol_lookback=None, vol_multiple=None, min_volume_t
             last_vol_val = vols[-1]
             prev_vols = vols[:-1]
 
-            if not (last_vol_val > 0 and all(v > 0 for v in prev_vols)):
+            if not (last_vol_val > 0 and (prev_vols > 0).all()):
                 meets_volume = False
-            elif not all(last_vol_val > v for v in prev_vols):
+            elif not (last_vol_val > prev_vols).all():
                 meets_volume = False
             else:
                 max_prev_vol = max(prev_vols)
@@ -512,13 +610,9 @@ def analyze_stock(stock_code, vol_lookback=None, vol_multiple=None, min_volume_t
         else:
             meets_volume = True
 
-        # ===== 檢查成交量門檻 =====
-        # 無論是否啟用爆量條件，都檢查最近一天成交量是否達到門檻
-        if last_vol_val is None:
-            last_vol_val = df['成交張數'].iloc[-1]
-        
-        if last_vol_val < min_threshold:
-            meets_volume = False
+        # 任一條件不符合就直接結束，不再計算後面的條件
+        if not meets_volume:
+            return None
 
         # ===== 條件 2 + 3：紅三兵 + 三大法人 =====
         meets_red_three = True
@@ -536,11 +630,8 @@ def analyze_stock(stock_code, vol_lookback=None, vol_multiple=None, min_volume_t
                 c1, c2, c3 = prices[0], prices[1], prices[2]
                 closes = (round(c1, 2), round(c2, 2), round(c3, 2))
 
-                if FLAG_RED_THREE:
-                    if not (c1 < c2 < c3):
-                        meets_red_three = False
-                else:
-                    meets_red_three = True
+                if FLAG_RED_THREE and not (c1 < c2 < c3):
+                    return None
 
                 if FLAG_NET_BUY:
                     foreign = recent_df['外陸資買賣超張數'].values
@@ -603,18 +694,12 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
             print(f"        ⚠️ 無法從資料庫讀取 {stock_code} {stock_name} 的資料")
             return False
         
-        # 轉換資料類型
-        df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
-        
-        # 移除千位分隔符逗號後再轉換數值
-        for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數',
-                    '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df.dropna(subset=['日期'], inplace=True)
-        df.sort_values('日期', inplace=True)
+        # 日期與數值欄位已在 read_stock_from_db 轉換完成
+        # 查詢時已排除空日期並依日期排序，只有日期無法解析或順序不對時才需要再整理
+        if df['日期'].hasnans:
+            df = df.dropna(subset=['日期'])
+        if not df['日期'].is_monotonic_increasing:
+            df = df.sort_values('日期')
         
         # 取得最後一天收盤價
         latest_close = df['收盤價'].iloc[-1]
@@ -636,541 +721,134 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         
         output_path = output_folder / output_filename
         
-        # 取最近60筆資料
-        df_chart = df.tail(60).copy()
-        
-        # 計算移動平均線
-        df_chart['MA5'] = df_chart['收盤價'].rolling(window=5, min_periods=1).mean()
-        df_chart['MA10'] = df_chart['收盤價'].rolling(window=10, min_periods=1).mean()
-        
-        # 創建子圖
-        fig = make_subplots(
-            rows=4, cols=1,
-            shared_xaxes=True,
-            vertical_spacing=0.03,
-            subplot_titles=('', '', '', ''),
-            row_heights=[0.4, 0.2, 0.2, 0.2],
-            specs=[[{"secondary_y": False}],
-                   [{"secondary_y": False}],
-                   [{"secondary_y": False}],
-                   [{"secondary_y": False}]]
-        )
-        
-        # 第一層：K線圖
-        fig.add_trace(
-            go.Candlestick(
-                x=df_chart['日期'],
-                open=df_chart['開盤價'],
-                high=df_chart['最高價'],
-                low=df_chart['最低價'],
-                close=df_chart['收盤價'],
-                name='K線',
-                increasing_line_color='#FF5252',
-                increasing_fillcolor='#FF5252',
-                decreasing_line_color='#00C851',
-                decreasing_fillcolor='#00C851',
-                line=dict(width=0.8),
-            ),
-            row=1, col=1
-        )
-        
-        # 添加MA5和MA10
-        for ma_name, ma_col, color in [('MA5', 'MA5', 'blue'), ('MA10', 'MA10', 'orange')]:
-            if ma_col in df_chart.columns and df_chart[ma_col].notna().sum() > 0:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_chart['日期'],
-                        y=df_chart[ma_col],
-                        name=ma_name,
-                        line=dict(color=color, width=1.5),
-                        mode='lines',
-                    ),
-                    row=1, col=1
-                )
-        
-        # 第二層：成交量
-        if '成交張數' in df_chart.columns:
-            volume_lots = pd.to_numeric(df_chart['成交張數'], errors='coerce')
-            colors = []
-            for i in range(len(df_chart)):
-                if i == 0:
-                    if df_chart['收盤價'].iloc[i] >= df_chart['開盤價'].iloc[i]:
-                        colors.append('rgba(255, 82, 82, 0.8)')
-                    else:
-                        colors.append('rgba(0, 200, 81, 0.8)')
-                else:
-                    if df_chart['收盤價'].iloc[i] >= df_chart['收盤價'].iloc[i-1]:
-                        colors.append('rgba(255, 82, 82, 0.8)')
-                    else:
-                        colors.append('rgba(0, 200, 81, 0.8)')
-            
-            fig.add_trace(
-                go.Bar(
-                    x=df_chart['日期'],
-                    y=volume_lots,
-                    name='成交量',
-                    marker=dict(color=colors, line=dict(width=0)),
-                    showlegend=True
-                ),
-                row=2, col=1
-            )
-        
-        # 第三層：三大法人當日買賣超
-        has_institutional = False
-        if '外陸資買賣超張數' in df_chart.columns:
-            foreign = pd.to_numeric(df_chart['外陸資買賣超張數'], errors='coerce')
-            trust = pd.to_numeric(df_chart.get('投信買賣超張數', 0), errors='coerce')
-            dealer = pd.to_numeric(df_chart.get('自營商買賣超張數', 0), errors='coerce')
-            
-            if foreign.notna().sum() > 0 or trust.notna().sum() > 0 or dealer.notna().sum() > 0:
-                has_institutional = True
-                for name, data, color in [
-                    ('外資', foreign, 'rgba(255, 82, 82, 0.75)'),
-                    ('投信', trust, 'rgba(0, 200, 81, 0.75)'),
-                    ('自營商', dealer, 'rgba(0, 191, 255, 0.75)')
-                ]:
-                    fig.add_trace(
-                        go.Bar(
-                            x=df_chart['日期'],
-                            y=data,
-                            name=name,
-                            marker_color=color,
-                            legendgroup=name,
-                            showlegend=True
-                        ),
-                        row=3, col=1
-                    )
-        
-        # 第四層：三大法人累積買賣超
-        if has_institutional:
-            foreign_cumsum = pd.to_numeric(df_chart['外陸資買賣超張數'], errors='coerce').fillna(0).cumsum()
-            trust_cumsum = pd.to_numeric(df_chart.get('投信買賣超張數', 0), errors='coerce').fillna(0).cumsum()
-            dealer_cumsum = pd.to_numeric(df_chart.get('自營商買賣超張數', 0), errors='coerce').fillna(0).cumsum()
-            
-            for name, data, color in [
-                ('外資', foreign_cumsum, 'rgb(255, 82, 82)'),
-                ('投信', trust_cumsum, 'rgb(0, 200, 81)'),
-                ('自營商', dealer_cumsum, 'rgb(0, 191, 255)')
-            ]:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_chart['日期'],
-                        y=data,
-                        name=f'{name}累積',
-                        line=dict(color=color, width=2.5, shape='spline', smoothing=0.8),
-                        mode='lines',
-                        legendgroup=name,
-                        showlegend=True
-                    ),
-                    row=4, col=1
-                )
-        
-        # 計算統計數據
-        latest = df_chart.iloc[-1]
-        latest_date_str = latest['日期'].strftime('%Y-%m-%d')
-        stats = {
-            '成交量': latest['成交張數'] if '成交張數' in latest and pd.notna(latest['成交張數']) else 0,
-            '外資累積': foreign_cumsum.iloc[-1] if has_institutional and len(foreign_cumsum) > 0 else 0,
-            '投信累積': trust_cumsum.iloc[-1] if has_institutional and len(trust_cumsum) > 0 else 0,
-            '自營累積': dealer_cumsum.iloc[-1] if has_institutional and len(dealer_cumsum) > 0 else 0,
-        }
-        
-        # 更新佈局
-        stats_line1 = (
-            f"最新資料日期: {latest_date_str} | "
-            f"外資累積: {stats['外資累積']:,.0f}張 | "
-            f"投信累積: {stats['投信累積']:,.0f}張 | "
-            f"自營累積: {stats['自營累積']:,.0f}張"
-        )
-        stats_line2 = f"股價K線圖 | 成交量: {stats['成交量']:,.0f}張"
-        
-        fig.update_layout(
-            title=dict(
-                text=f'{stock_code} {stock_name} ({stock_type} | {stock_sector}) 技術分析圖表 (最近60筆)<br><sub>{stats_line1}</sub><br><sub>{stats_line2}</sub>',
-                x=0.5,
-                xanchor='center',
-                font=dict(size=16, family='Microsoft JhengHei, Arial, sans-serif')
-            ),
-            xaxis_rangeslider_visible=False,
-            height=1500,
-            showlegend=True,
-            hovermode='x unified',
-            template='plotly_white',
-            barmode='relative',
-            legend=dict(
-                orientation="v",
-                yanchor="top",
-                y=0.98,
-                xanchor="left",
-                x=0.01,
-                bgcolor="rgba(255, 255, 255, 0.8)",
-                bordercolor="lightgray",
-                borderwidth=1,
-                font=dict(family='Microsoft JhengHei, Arial, sans-serif')
-            ),
-            font=dict(family='Microsoft JhengHei, Arial, sans-serif'),
-            dragmode='pan'
-        )
-        
-        # 更新Y軸
-        price_cols = ['開盤價', '最高價', '最低價', '收盤價']
-        price_min = df_chart[price_cols].min().min()
-        price_max = df_chart[price_cols].max().max()
-        price_margin = (price_max - price_min) * 0.05
-        price_range = [price_min - price_margin, price_max + price_margin]
-        
-        fig.update_yaxes(title_text="股價 (元)", row=1, col=1, range=price_range, fixedrange=True)
-        fig.update_yaxes(title_text="成交量 (張)", row=2, col=1, tickformat=",", fixedrange=True)
-        fig.update_yaxes(title_text="當日買賣超 (張)", row=3, col=1, tickformat=",", fixedrange=True)
-        fig.update_yaxes(title_text="累積買賣超 (張)", row=4, col=1, tickformat=",", fixedrange=True)
-        
-        # 更新X軸 - 移除非交易日空隙
-        start_date = df_chart['日期'].min()
-        end_date = df_chart['日期'].max()
-        trading_dates = df_chart['日期'].tolist()
-        
-        # 生成刻度值（每月1、6、11、16、21、26日）
-        tickvals = []
-        current = start_date.replace(day=1)
-        while current <= end_date:
-            for day in [1, 6, 11, 16, 21, 26]:
-                try:
-                    tick_date = current.replace(day=day)
-                    if start_date <= tick_date <= end_date:
-                        tickvals.append(tick_date)
-                except:
-                    pass
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                current = current.replace(month=current.month + 1)
-        
-        for i in range(1, 5):
-            fig.update_xaxes(
-                tickformat="%m-%d",
-                tickangle=-45,
-                tickmode='array',
-                tickvals=tickvals,
-                showticklabels=True,
-                autorange=True,
-                hoverformat="%m-%d",
-                fixedrange=True,
-                rangebreaks=[
-                    dict(values=pd.date_range(start=start_date, end=end_date, freq='D')
-                         .difference(pd.DatetimeIndex(trading_dates)).tolist())
-                ],
-                row=i, col=1
-            )
-        
-        # 生成HTML
-        html_string = fig.to_html(include_plotlyjs='cdn')
-        
-        # 生成分析區塊的HTML
-        # 根據操作建議選擇顏色
-        action_colors = {
-            '重倉': '#FF4444',
-            '上車': '#00C851',
-            '觀望': '#FFA500',
-            '減倉': '#FF8800',
-            '清倉': '#CC0000'
-        }
-        action_color = action_colors.get(analysis['action'], '#666666')
-        
-        # 根據風險等級選擇顏色
-        risk_colors = {
-            '低': '#00C851',
-            '中': '#FFA500',
-            '高': '#FF4444'
-        }
-        risk_color = risk_colors.get(analysis['risk_level'], '#666666')
-        
-        # 生成信號列表HTML
-        signals_html = ""
-        if analysis['signals']:
-            signals_html = "<ul style='margin: 10px 0; padding-left: 25px; line-height: 1.8;'>"
-            for signal in analysis['signals']:
-                signals_html += f"<li style='margin: 5px 0;'>{signal}</li>"
-            signals_html += "</ul>"
-        else:
-            signals_html = "<p style='color: #999; font-style: italic;'>暫無明確信號</p>"
-        
-        # 評分進度條
-        score = analysis['score']
-        # 將評分映射到 0-100 的進度條（-10到10映射到0-100）
-        progress = min(100, max(0, (score + 10) * 5))
-        
-        # 根據評分選擇進度條顏色
-        if score >= 5:
-            progress_color = '#00C851'  # 綠色
-        elif score >= 0:
-            progress_color = '#FFA500'  # 橙色
-        elif score >= -5:
-            progress_color = '#FF8800'  # 深橙
-        else:
-            progress_color = '#FF4444'  # 紅色
-        
-        analysis_block = f'''
-<div style="max-width: 1200px; margin: 30px auto; padding: 20px; font-family: 'Microsoft JhengHei', Arial, sans-serif;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px 10px 0 0; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-        <h2 style="margin: 0; font-size: 24px; display: flex; align-items: center;">
-            <span style="font-size: 30px; margin-right: 10px;">📊</span>
-            量價戰法分析
-        </h2>
-        <p style="margin: 5px 0 0 0; font-size: 14px; opacity: 0.9;">基於量價關係、K線型態、趨勢判斷的綜合分析</p>
-    </div>
-    
-    <div style="background: white; padding: 25px; border: 1px solid #e0e0e0; border-top: none; border-radius: 0 0 10px 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-        <!-- 核心指標卡片 -->
-        <div style="display: flex; gap: 15px; margin-bottom: 25px; flex-wrap: wrap;">
-            <!-- 操作建議卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {action_color}15, {action_color}25); border-left: 4px solid {action_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">💡 操作建議</div>
-                <div style="font-size: 28px; font-weight: bold; color: {action_color};">{analysis['action']}</div>
-            </div>
-            
-            <!-- 風險等級卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {risk_color}15, {risk_color}25); border-left: 4px solid {risk_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">⚠️ 風險等級</div>
-                <div style="font-size: 28px; font-weight: bold; color: {risk_color};">{analysis['risk_level']}</div>
-            </div>
-            
-            <!-- 評分卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {progress_color}15, {progress_color}25); border-left: 4px solid {progress_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">📈 綜合評分</div>
-                <div style="font-size: 28px; font-weight: bold; color: {progress_color};">{score} 分</div>
-                <div style="background: #e0e0e0; height: 8px; border-radius: 4px; margin-top: 8px; overflow: hidden;">
-                    <div style="background: {progress_color}; height: 100%; width: {progress}%; transition: width 0.3s ease;"></div>
-                </div>
-            </div>
-        </div>
-        
-        <!-- 信號列表 -->
-        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; border: 1px solid #e9ecef;">
-            <h3 style="margin: 0 0 15px 0; font-size: 18px; color: #333; display: flex; align-items: center;">
-                <span style="font-size: 22px; margin-right: 8px;">🔍</span>
-                技術信號分析
-            </h3>
-            {signals_html}
-        </div>
-        
-        <!-- 評分說明 -->
-        <div style="margin-top: 20px; padding: 15px; background: #fff3cd; border-left: 4px solid #ffc107; border-radius: 4px;">
-            <div style="font-size: 14px; color: #856404; line-height: 1.6;">
-                <strong>📖 評分標準：</strong>
-                <span style="display: inline-block; margin: 0 10px;">≥8分=重倉</span>
-                <span style="display: inline-block; margin: 0 10px;">5-7分=上車</span>
-                <span style="display: inline-block; margin: 0 10px;">-4~4分=觀望</span>
-                <span style="display: inline-block; margin: 0 10px;">-5~-7分=減倉</span>
-                <span style="display: inline-block; margin: 0 10px;">≤-8分=清倉</span>
-            </div>
-        </div>
-        
-        <!-- 免責聲明 -->
-        <div style="margin-top: 20px; padding: 12px; background: #f8f9fa; border-radius: 4px; font-size: 12px; color: #6c757d; text-align: center;">
-            ⚠️ 本分析僅供參考，不構成投資建議。股市有風險，投資需謹慎。
-        </div>
-    </div>
-</div>
-'''
-        
-        # 包裝完整HTML
-        viewport_meta = '<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, minimum-scale=1.0, user-scalable=no">'
-        full_html = f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    {viewport_meta}
-    <title>{action} - {stock_code} {stock_name}</title>
-    <style>
-        body {{ margin: 0; padding: 0; background: #f5f5f5; }}
-    </style>
-</head>
-<body>
-{html_string}
-{analysis_block}
-</body>
-</html>'''
-        
-        # 儲存檔案
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_html)
-        
-        print(f"  ✓ 圖表已生成: {output_path}")
-        
-        # 在終端也輸出分析
-        print(f"  📊 走勢分析:")
-        print(f"     操作建議: {analysis['action']} | 風險等級: {analysis['risk_level']} | 評分: {analysis['score']}")
+        # 取最近60筆資料（只讀取，不需複製）
+        df_chart = df.iloc[-60:]
         
-        if analysis['signals']:
-            print(f"     信號列表:")
-            for signal in analysis['signals']:
-                print(f"       • {signal}")
+        # 各層共用的欄位先取出一次（NumPy 陣列直接交給 plotly 序列化）
+        dates = [d.isoformat() for d in df_chart['日期']]
+        open_arr = df_chart['開盤價'].to_numpy()
+        high_arr = df_chart['最高價'].to_numpy()
+        low_arr = df_chart['最低價'].to_numpy()
+        close_arr = df_chart['收盤價'].to_numpy()
         
-        return True
+        # 計算移動平均線（只用於繪圖，保留為區域陣列）
+        ma5_arr = moving_average(close_arr, 5)
+        ma10_arr = moving_average(close_arr, 10)
         
-    except Exception as e:
-        print(f"  ❌ 生成圖表失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-    """生成單檔股票的HTML圖表"""
-    try:
-        # 讀取資料
-        df = pd.read_csv(csv_file, encoding='utf-8')
-        
-        # 轉換資料類型
-        df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
-        
-        # 移除千位分隔符逗號後再轉換數值
-        for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數',
-                    '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df.dropna(subset=['日期'], inplace=True)
-        df.sort_values('日期', inplace=True)
-        
-        # 取最近60筆資料
-        df_chart = df.tail(60).copy()
-        
-        # 計算移動平均線
-        df_chart['MA5'] = df_chart['收盤價'].rolling(window=5, min_periods=1).mean()
-        df_chart['MA10'] = df_chart['收盤價'].rolling(window=10, min_periods=1).mean()
-        
-        # 創建子圖
-        fig = make_subplots(
-            rows=4, cols=1,
-            shared_xaxes=True,
-            vertical_spacing=0.03,
-            subplot_titles=('', '', '', ''),
-            row_heights=[0.4, 0.2, 0.2, 0.2],
-            specs=[[{"secondary_y": False}],
-                   [{"secondary_y": False}],
-                   [{"secondary_y": False}],
-                   [{"secondary_y": False}]]
-        )
+        # 各層圖表直接以 dict 描述（版面共用 get_chart_base_layout 的快取，不再逐檔建立與驗證 plotly 物件）
+        traces = []
         
         # 第一層：K線圖
-        fig.add_trace(
-            go.Candlestick(
-                x=df_chart['日期'],
-                open=df_chart['開盤價'],
-                high=df_chart['最高價'],
-                low=df_chart['最低價'],
-                close=df_chart['收盤價'],
-                name='K線',
-                increasing_line_color='#FF5252',
-                increasing_fillcolor='#FF5252',
-                decreasing_line_color='#00C851',
-                decreasing_fillcolor='#00C851',
-                line=dict(width=0.8),
-            ),
-            row=1, col=1
-        )
+        traces.append(dict(
+            type='candlestick',
+            x=dates,
+            open=open_arr,
+            high=high_arr,
+            low=low_arr,
+            close=close_arr,
+            name='K線',
+            increasing=dict(line=dict(color='#FF5252'), fillcolor='#FF5252'),
+            decreasing=dict(line=dict(color='#00C851'), fillcolor='#00C851'),
+            line=dict(width=0.8),
+            xaxis='x', yaxis='y'
+        ))
         
         # 添加MA5和MA10
-        for ma_name, ma_col, color in [('MA5', 'MA5', 'blue'), ('MA10', 'MA10', 'orange')]:
-            if ma_col in df_chart.columns and df_chart[ma_col].notna().sum() > 0:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_chart['日期'],
-                        y=df_chart[ma_col],
-                        name=ma_name,
-                        line=dict(color=color, width=1.5),
-                        mode='lines',
-                    ),
-                    row=1, col=1
-                )
+        for ma_name, ma_arr, color in [('MA5', ma5_arr, 'blue'), ('MA10', ma10_arr, 'orange')]:
+            if (~np.isnan(ma_arr)).any():
+                traces.append(dict(
+                    type='scatter',
+                    x=dates,
+                    y=ma_arr,
+                    name=ma_name,
+                    line=dict(color=color, width=1.5),
+                    mode='lines',
+                    xaxis='x', yaxis='y'
+                ))
         
         # 第二層：成交量
         if '成交張數' in df_chart.columns:
-            volume_lots = pd.to_numeric(df_chart['成交張數'], errors='coerce')
-            colors = []
-            for i in range(len(df_chart)):
-                if i == 0:
-                    if df_chart['收盤價'].iloc[i] >= df_chart['開盤價'].iloc[i]:
-                        colors.append('rgba(255, 82, 82, 0.8)')
-                    else:
-                        colors.append('rgba(0, 200, 81, 0.8)')
-                else:
-                    if df_chart['收盤價'].iloc[i] >= df_chart['收盤價'].iloc[i-1]:
-                        colors.append('rgba(255, 82, 82, 0.8)')
-                    else:
-                        colors.append('rgba(0, 200, 81, 0.8)')
+            volume_lots = df_chart['成交張數'].to_numpy()
+            # 收盤價 >= 前一日收盤價（第一天與當日開盤價比較）為紅，否則為綠
+            prev_close = np.empty_like(close_arr)
+            prev_close[:1] = open_arr[:1]
+            prev_close[1:] = close_arr[:-1]
+            colors = np.where(close_arr >= prev_close, 'rgba(255, 82, 82, 0.8)', 'rgba(0, 200, 81, 0.8)').tolist()
             
-            fig.add_trace(
-                go.Bar(
-                    x=df_chart['日期'],
-                    y=volume_lots,
-                    name='成交量',
-                    marker=dict(color=colors, line=dict(width=0)),
-                    showlegend=True
-                ),
-                row=2, col=1
-            )
+            traces.append(dict(
+                type='bar',
+                x=dates,
+                y=volume_lots,
+                name='成交量',
+                marker=dict(color=colors, line=dict(width=0)),
+                showlegend=True,
+                xaxis='x2', yaxis='y2'
+            ))
         
         # 第三層：三大法人當日買賣超
         has_institutional = False
         if '外陸資買賣超張數' in df_chart.columns:
-            foreign = pd.to_numeric(df_chart['外陸資買賣超張數'], errors='coerce')
-            trust = pd.to_numeric(df_chart.get('投信買賣超張數', 0), errors='coerce')
-            dealer = pd.to_numeric(df_chart.get('自營商買賣超張數', 0), errors='coerce')
+            # 數值欄位已在 read_stock_from_db 轉換過，直接取出陣列；缺少的欄位視為無資料
+            missing = np.full(len(df_chart), np.nan)
+            foreign = df_chart['外陸資買賣超張數'].to_numpy(dtype=np.float64)
+            trust = df_chart['投信買賣超張數'].to_numpy(dtype=np.float64) if '投信買賣超張數' in df_chart.columns else missing
+            dealer = df_chart['自營商買賣超張數'].to_numpy(dtype=np.float64) if '自營商買賣超張數' in df_chart.columns else missing
             
-            if foreign.notna().sum() > 0 or trust.notna().sum() > 0 or dealer.notna().sum() > 0:
+            # 三者任一有資料就畫（一次 .any()，找到第一個有效值即可）
+            if (~(np.isnan(foreign) & np.isnan(trust) & np.isnan(dealer))).any():
                 has_institutional = True
                 for name, data, color in [
                     ('外資', foreign, 'rgba(255, 82, 82, 0.75)'),
                     ('投信', trust, 'rgba(0, 200, 81, 0.75)'),
                     ('自營商', dealer, 'rgba(0, 191, 255, 0.75)')
                 ]:
-                    fig.add_trace(
-                        go.Bar(
-                            x=df_chart['日期'],
-                            y=data,
-                            name=name,
-                            marker_color=color,
-                            legendgroup=name,
-                            showlegend=True
-                        ),
-                        row=3, col=1
-                    )
+                    traces.append(dict(
+                        type='bar',
+                        x=dates,
+                        y=data,
+                        name=name,
+                        marker=dict(color=color),
+                        legendgroup=name,
+                        showlegend=True,
+                        xaxis='x3', yaxis='y3'
+                    ))
         
         # 第四層：三大法人累積買賣超
         if has_institutional:
-            foreign_cumsum = pd.to_numeric(df_chart['外陸資買賣超張數'], errors='coerce').fillna(0).cumsum()
-            trust_cumsum = pd.to_numeric(df_chart.get('投信買賣超張數', 0), errors='coerce').fillna(0).cumsum()
-            dealer_cumsum = pd.to_numeric(df_chart.get('自營商買賣超張數', 0), errors='coerce').fillna(0).cumsum()
+            # 沿用上面已轉換的當日買賣超，三者疊成一個陣列一次做累積和
+            stacked = np.vstack([foreign, trust, dealer])
+            stacked[np.isnan(stacked)] = 0
+            foreign_cumsum, trust_cumsum, dealer_cumsum = np.cumsum(stacked, axis=1)
             
             for name, data, color in [
                 ('外資', foreign_cumsum, 'rgb(255, 82, 82)'),
                 ('投信', trust_cumsum, 'rgb(0, 200, 81)'),
                 ('自營商', dealer_cumsum, 'rgb(0, 191, 255)')
             ]:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_chart['日期'],
-                        y=data,
-                        name=f'{name}累積',
-                        line=dict(color=color, width=2.5, shape='spline', smoothing=0.8),
-                        mode='lines',
-                        legendgroup=name,
-                        showlegend=True
-                    ),
-                    row=4, col=1
-                )
+                traces.append(dict(
+                    type='scatter',
+                    x=dates,
+                    y=data,
+                    name=f'{name}累積',
+                    line=dict(color=color, width=2.5),
+                    mode='lines',
+                    legendgroup=name,
+                    showlegend=True,
+                    xaxis='x4', yaxis='y4'
+                ))
         
         # 計算統計數據
-        latest = df_chart.iloc[-1]
-        latest_date_str = latest['日期'].strftime('%Y-%m-%d')
+        # 直接取最後一個值，不必把整列組成 Series
+        latest_date_str = df_chart['日期'].iat[-1].strftime('%Y-%m-%d')
+        latest_volume = df_chart['成交張數'].iat[-1] if '成交張數' in df_chart.columns else 0
         stats = {
-            '成交量': latest['成交張數'] if '成交張數' in latest and pd.notna(latest['成交張數']) else 0,
-            '外資累積': foreign_cumsum.iloc[-1] if has_institutional and len(foreign_cumsum) > 0 else 0,
-            '投信累積': trust_cumsum.iloc[-1] if has_institutional and len(trust_cumsum) > 0 else 0,
-            '自營累積': dealer_cumsum.iloc[-1] if has_institutional and len(dealer_cumsum) > 0 else 0,
+            '成交量': latest_volume if pd.notna(latest_volume) else 0,
+            '外資累積': foreign_cumsum[-1] if has_institutional and len(foreign_cumsum) > 0 else 0,
+            '投信累積': trust_cumsum[-1] if has_institutional and len(trust_cumsum) > 0 else 0,
+            '自營累積': dealer_cumsum[-1] if has_institutional and len(dealer_cumsum) > 0 else 0,
         }
         
-        # 更新佈局
+        # 更新佈局（只覆寫每檔不同的部分，共用版面本身不會被修改）
         stats_line1 = (
             f"最新資料日期: {latest_date_str} | "
             f"外資累積: {stats['外資累積']:,.0f}張 | "
@@ -1179,116 +857,51 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         )
         stats_line2 = f"股價K線圖 | 成交量: {stats['成交量']:,.0f}張"
         
-        fig.update_layout(
-            title=dict(
-                text=f'{stock_code} {stock_name} ({stock_type} | {stock_sector}) 技術分析圖表 (最近60筆)<br><sub>{stats_line1}</sub><br><sub>{stats_line2}</sub>',
-                x=0.5,
-                xanchor='center',
-                font=dict(size=16, family='Microsoft JhengHei, Arial, sans-serif')
-            ),
-            xaxis_rangeslider_visible=False,
-            height=1500,
-            showlegend=True,
-            hovermode='x unified',
-            template='plotly_white',
-            barmode='relative',
-            legend=dict(
-                orientation="v",
-                yanchor="top",
-                y=0.98,
-                xanchor="left",
-                x=0.01,
-                bgcolor="rgba(255, 255, 255, 0.8)",
-                bordercolor="lightgray",
-                borderwidth=1,
-                font=dict(family='Microsoft JhengHei, Arial, sans-serif')
-            ),
-            font=dict(family='Microsoft JhengHei, Arial, sans-serif'),
-            dragmode='pan'
+        base_layout = get_chart_base_layout()
+        layout = dict(base_layout)
+        layout['title'] = dict(
+            text=f'{stock_code} {stock_name} ({stock_type} | {stock_sector}) 技術分析圖表 (最近60筆)<br><sub>{stats_line1}</sub><br><sub>{stats_line2}</sub>',
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16, family=CHART_FONT_FAMILY)
         )
         
         # 更新Y軸
-        price_cols = ['開盤價', '最高價', '最低價', '收盤價']
-        price_min = df_chart[price_cols].min().min()
-        price_max = df_chart[price_cols].max().max()
+        price_block = np.vstack([open_arr, high_arr, low_arr, close_arr]).astype(np.float64)
+        price_min = np.nanmin(price_block)
+        price_max = np.nanmax(price_block)
         price_margin = (price_max - price_min) * 0.05
         price_range = [price_min - price_margin, price_max + price_margin]
         
-        fig.update_yaxes(title_text="股價 (元)", row=1, col=1, range=price_range, fixedrange=True)
-        fig.update_yaxes(title_text="成交量 (張)", row=2, col=1, tickformat=",", fixedrange=True)
-        fig.update_yaxes(title_text="當日買賣超 (張)", row=3, col=1, tickformat=",", fixedrange=True)
-        fig.update_yaxes(title_text="累積買賣超 (張)", row=4, col=1, tickformat=",", fixedrange=True)
+        layout['yaxis'] = dict(base_layout['yaxis'], range=price_range)
         
         # 更新X軸 - 移除非交易日空隙
         start_date = df_chart['日期'].min()
         end_date = df_chart['日期'].max()
-        trading_dates = df_chart['日期'].tolist()
         
         # 生成刻度值（每月1、6、11、16、21、26日）
-        tickvals = []
-        current = start_date.replace(day=1)
-        while current <= end_date:
-            for day in [1, 6, 11, 16, 21, 26]:
-                try:
-                    tick_date = current.replace(day=day)
-                    if start_date <= tick_date <= end_date:
-                        tickvals.append(tick_date)
-                except:
-                    pass
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                current = current.replace(month=current.month + 1)
-        
-        for i in range(1, 5):
-            fig.update_xaxes(
-                tickformat="%m-%d",
-                tickangle=-45,
-                tickmode='array',
-                tickvals=tickvals,
-                showticklabels=True,
-                autorange=True,
-                hoverformat="%m-%d",
-                fixedrange=True,
-                rangebreaks=[
-                    dict(values=pd.date_range(start=start_date, end=end_date, freq='D')
-                         .difference(pd.DatetimeIndex(trading_dates)).tolist())
-                ],
-                row=i, col=1
-            )
+        all_days = pd.date_range(start=start_date, end=end_date, freq='D')
+        tickvals = [d.isoformat() for d in all_days[all_days.day.isin(CHART_TICK_DAYS)]]
         
-        # 執行量價分析
-        analysis = analyze_volume_price_pattern(df)
+        # 非交易日只算一次，4 層子圖共用同一份 rangebreaks
+        non_trading = [d.isoformat() for d in all_days[~all_days.isin(df_chart['日期'])]]
+        rangebreaks = [dict(values=non_trading)]
+        for axis in ['xaxis', 'xaxis2', 'xaxis3', 'xaxis4']:
+            layout[axis] = dict(base_layout[axis], tickvals=tickvals, rangebreaks=rangebreaks)
         
-        # 生成HTML
-        html_string = fig.to_html(include_plotlyjs='cdn')
+        # 生成HTML（資料已是純 dict，略過 plotly 的逐欄驗證）
+        html_string = chart_to_html(dict(data=traces, layout=layout))
         
         # 生成分析區塊的HTML
-        # 根據操作建議選擇顏色
-        action_colors = {
-            '重倉': '#FF4444',
-            '上車': '#00C851',
-            '觀望': '#FFA500',
-            '減倉': '#FF8800',
-            '清倉': '#CC0000'
-        }
-        action_color = action_colors.get(analysis['action'], '#666666')
-        
-        # 根據風險等級選擇顏色
-        risk_colors = {
-            '低': '#00C851',
-            '中': '#FFA500',
-            '高': '#FF4444'
-        }
-        risk_color = risk_colors.get(analysis['risk_level'], '#666666')
+        # 根據操作建議、風險等級選擇顏色
+        action_color = ACTION_COLORS.get(analysis['action'], '#666666')
+        risk_color = RISK_COLORS.get(analysis['risk_level'], '#666666')
         
         # 生成信號列表HTML
-        signals_html = ""
         if analysis['signals']:
-            signals_html = "<ul style='margin: 10px 0; padding-left: 25px; line-height: 1.8;'>"
-            for signal in analysis['signals']:
-                signals_html += f"<li style='margin: 5px 0;'>{signal}</li>"
-            signals_html += "</ul>"
+            signals_html = ("<ul style='margin: 10px 0; padding-left: 25px; line-height: 1.8;'>"
+                            + "".join(f"<li style='margin: 5px 0;'>{signal}</li>" for signal in analysis['signals'])
+                            + "</ul>")
         else:
             signals_html = "<p style='color: #999; font-style: italic;'>暫無明確信號</p>"
         
@@ -1307,91 +920,22 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         else:
             progress_color = '#FF4444'  # 紅色
         
-        analysis_block = f'''
-<div style="max-width: 1200px; margin: 30px auto; padding: 20px; font-family: 'Microsoft JhengHei', Arial, sans-serif;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px 10px 0 0; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-        <h2 style="margin: 0; font-size: 24px; display: flex; align-items: center;">
-            <span style="font-size: 30px; margin-right: 10px;">📊</span>
-            量價戰法分析
-        </h2>
-        <p style="margin: 5px 0 0 0; font-size: 14px; opacity: 0.9;">基於量價關係、K線型態、趨勢判斷的綜合分析</p>
-    </div>
-    
-    <div style="background: white; padding: 25px; border: 1px solid #e0e0e0; border-top: none; border-radius: 0 0 10px 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-        <!-- 核心指標卡片 -->
-        <div style="display: flex; gap: 15px; margin-bottom: 25px; flex-wrap: wrap;">
-            <!-- 操作建議卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {action_color}15, {action_color}25); border-left: 4px solid {action_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">💡 操作建議</div>
-                <div style="font-size: 28px; font-weight: bold; color: {action_color};">{analysis['action']}</div>
-            </div>
-            
-            <!-- 風險等級卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {risk_color}15, {risk_color}25); border-left: 4px solid {risk_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">⚠️ 風險等級</div>
-                <div style="font-size: 28px; font-weight: bold; color: {risk_color};">{analysis['risk_level']}</div>
-            </div>
-            
-            <!-- 評分卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {progress_color}15, {progress_color}25); border-left: 4px solid {progress_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">📈 綜合評分</div>
-                <div style="font-size: 28px; font-weight: bold; color: {progress_color};">{score} 分</div>
-                <div style="background: #e0e0e0; height: 8px; border-radius: 4px; margin-top: 8px; overflow: hidden;">
-                    <div style="background: {progress_color}; height: 100%; width: {progress}%; transition: width 0.3s ease;"></div>
-                </div>
-            </div>
-        </div>
-        
-        <!-- 信號列表 -->
-        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; border: 1px solid #e9ecef;">
-            <h3 style="margin: 0 0 15px 0; font-size: 18px; color: #333; display: flex; align-items: center;">
-                <span style="font-size: 22px; margin-right: 8px;">🔍</span>
-                技術信號分析
-            </h3>
-            {signals_html}
-        </div>
-        
-        <!-- 評分說明 -->
-        <div style="margin-top: 20px; padding: 15px; background: #fff3cd; border-left: 4px solid #ffc107; border-radius: 4px;">
-            <div style="font-size: 14px; color: #856404; line-height: 1.6;">
-                <strong>📖 評分標準：</strong>
-                <span style="display: inline-block; margin: 0 10px;">≥8分=重倉</span>
-                <span style="display: inline-block; margin: 0 10px;">5-7分=上車</span>
-                <span style="display: inline-block; margin: 0 10px;">-4~4分=觀望</span>
-                <span style="display: inline-block; margin: 0 10px;">-5~-7分=減倉</span>
-                <span style="display: inline-block; margin: 0 10px;">≤-8分=清倉</span>
-            </div>
-        </div>
-        
-        <!-- 免責聲明 -->
-        <div style="margin-top: 20px; padding: 12px; background: #f8f9fa; border-radius: 4px; font-size: 12px; color: #6c757d; text-align: center;">
-            ⚠️ 本分析僅供參考，不構成投資建議。股市有風險，投資需謹慎。
-        </div>
-    </div>
-</div>
-'''
+        analysis_block = ANALYSIS_BLOCK_TEMPLATE.format(
+            action=analysis['action'], action_color=action_color,
+            risk_level=analysis['risk_level'], risk_color=risk_color,
+            score=score, progress=progress, progress_color=progress_color,
+            signals_html=signals_html
+        )
         
         # 包裝完整HTML
-        viewport_meta = '<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, minimum-scale=1.0, user-scalable=no">'
-        full_html = f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    {viewport_meta}
-    <title>{stock_code} {stock_name}</title>
-    <style>
-        body {{ margin: 0; padding: 0; background: #f5f5f5; }}
-    </style>
-</head>
-<body>
-{html_string}
-{analysis_block}
-</body>
-</html>'''
-        
-        # 儲存檔案
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_html)
+        full_html = CHART_PAGE_TEMPLATE.format(
+            title=f"{action} - {stock_code} {stock_name}",
+            chart_html=html_string,
+            analysis_block=analysis_block
+        )
+        
+        # 儲存檔案（一次編碼、一次寫入）
+        output_path.write_bytes(full_html.encode('utf-8'))
         
         print(f"  ✓ 圖表已生成: {output_path}")
         
@@ -1408,34 +952,44 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         
     except Exception as e:
         print(f"  ❌ 生成圖表失敗: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
+# ==============================
+# 🧵 平行生成圖表
+# ==============================
+def init_chart_worker():
+    """
+    子行程不可沿用父行程開啟的 SQLite 連線（包含鎖定中的 stock_hot.db），清空後由 get_db_connection 重新開啟
+    （DB_CONNECTIONS 是 stock_common 的共用連線表；stock_hot.db 的連線則只屬於本程式）
+    """
+    DB_CONNECTIONS.clear()
+    HOT_DB_CONNECTIONS.clear()
+
 # ==============================
 # 💾 保存到 stock_hot.db
 # ==============================
-def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=None, is_first_stage=True):
-    """將符合條件的股票完整交易歷史保存到 stock_hot.db
-    
-    參數:
-        focus_stock_codes: focus_stocks.csv 中的股票代碼集合
-        is_first_stage: True=第一階段（會刪除舊資料庫），False=第二階段（追加資料）
+def get_hot_db_connection(is_first_stage):
     """
-    try:
-        db_path = "stock_data/stock_hot.db"
-        
-        # 第一階段：刪除舊資料庫，創建全新資料庫
-        if is_first_stage:
-            if Path(db_path).exists():
-                Path(db_path).unlink()
-                print(f"🗑️  已刪除舊資料庫")
-        
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+    取得 stock_hot.db 的共用寫入連線，第二階段沿用第一階段開啟的連線
+    第一階段會先關閉舊連線並刪除舊資料庫，再重新建立全新資料庫
+    """
+    conn = HOT_DB_CONNECTIONS.pop(HOT_DB_PATH, None)
+    if is_first_stage:
+        if conn is not None:
+            conn.close()
+            conn = None
+        if Path(HOT_DB_PATH).exists():
+            Path(HOT_DB_PATH).unlink()
+            print(f"🗑️  已刪除舊資料庫")
+    
+    if conn is None:
+        conn = sqlite3.connect(HOT_DB_PATH)
+        conn.execute("PRAGMA temp_store=MEMORY")          # 暫存資料放在記憶體
+        conn.execute("PRAGMA locking_mode=EXCLUSIVE")     # 只有本程式寫入，鎖定後不再逐筆檢查檔案鎖
         
         # 創建表格 - 包含完整的 OHLCV 資料
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS hot_stocks (
                 股票代碼 TEXT,
                 股票名稱 TEXT,
@@ -1463,10 +1017,37 @@ def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=Non
                 PRIMARY KEY (股票代碼, 日期)
             )
         ''')
+    
+    HOT_DB_CONNECTIONS[HOT_DB_PATH] = conn
+    return conn
+
+def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=None, is_first_stage=True):
+    """將符合條件的股票完整交易歷史保存到 stock_hot.db
+    
+    參數:
+        focus_stock_codes: focus_stocks.csv 中的股票代碼集合
+        is_first_stage: True=第一階段（會刪除舊資料庫），False=第二階段（追加資料）
+    """
+    try:
+        db_path = HOT_DB_PATH
+        conn = get_hot_db_connection(is_first_stage)
+        cursor = conn.cursor()
+        
+        # 整批寫入包在一個交易中，開始時即取得寫入鎖
+        cursor.execute("BEGIN IMMEDIATE")
         
-        from datetime import datetime
         update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
+        insert_sql = '''
+            INSERT OR REPLACE INTO hot_stocks 
+            (股票代碼, 股票名稱, 類型, 產業分類, 日期, 
+             開盤價, 最高價, 最低價, 收盤價, 成交量,
+             成交筆數, 成交金額, 本益比,
+             外陸資買賣超張數, 投信買賣超張數, 自營商買賣超張數,
+             操作建議, 風險等級, 評分, 走勢分析, 信號列表, 更新時間, IS_FOCUS)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        
         total_records = 0
         for r in results:
             code = r['code']
@@ -1480,73 +1061,46 @@ def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=Non
             if stock_df is None or len(stock_df) == 0:
                 continue
             
-            # 確保數據類型正確
-            stock_df = stock_df.copy()
-            for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數']:
-                if col in stock_df.columns:
-                    stock_df[col] = stock_df[col].astype(str).str.replace(',', '', regex=False)
-                    stock_df[col] = pd.to_numeric(stock_df[col], errors='coerce')
-            
-            # 只對最近的資料進行量價分析（節省運算時間）
+            # 只對最近的資料進行量價分析（節省運算時間；數值欄位已在 read_stock_from_db 轉換過）
             analysis = None
             if len(stock_df) >= 10:
                 analysis = analyze_volume_price_pattern(stock_df)
             
-            # 將每一天的資料都寫入資料庫
-            for idx, row in stock_df.iterrows():
-                # 轉換日期格式為統一格式 YYYY.MM.DD
-                try:
-                    date_obj = pd.to_datetime(row['日期'])
-                    date_str = date_obj.strftime('%Y.%m.%d')
-                except:
-                    date_str = str(row['日期'])
-                
-                # 對於最後一天的資料，附加量價分析結果
-                is_latest = (idx == stock_df.index[-1])
-                if is_latest and analysis:
-                    action = analysis['action']
-                    risk_level = analysis['risk_level']
-                    score = analysis.get('score', 0)
-                    summary = analysis.get('summary', '')
-                    signals = json.dumps(analysis.get('signals', []), ensure_ascii=False)
-                else:
-                    # 歷史資料不進行分析，留空
-                    action = ''
-                    risk_level = ''
-                    score = 0
-                    summary = ''
-                    signals = '[]'
-                
-                # 判斷是否為 focus 股票
-                is_focus = 1 if (focus_stock_codes and code in focus_stock_codes) else 0
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO hot_stocks 
-                    (股票代碼, 股票名稱, 類型, 產業分類, 日期, 
-                     開盤價, 最高價, 最低價, 收盤價, 成交量,
-                     成交筆數, 成交金額, 本益比,
-                     外陸資買賣超張數, 投信買賣超張數, 自營商買賣超張數,
-                     操作建議, 風險等級, 評分, 走勢分析, 信號列表, 更新時間, IS_FOCUS)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    code, name, type_str, sector, date_str,
-                    float(row.get('開盤價', 0)) if not pd.isna(row.get('開盤價')) else 0,
-                    float(row.get('最高價', 0)) if not pd.isna(row.get('最高價')) else 0,
-                    float(row.get('最低價', 0)) if not pd.isna(row.get('最低價')) else 0,
-                    float(row.get('收盤價', 0)) if not pd.isna(row.get('收盤價')) else 0,
-                    int(row.get('成交張數', 0)) if not pd.isna(row.get('成交張數')) else 0,
-                    str(row.get('成交筆數', '')),
-                    str(row.get('成交金額', '')),
-                    str(row.get('本益比', '')),
-                    float(row.get('外陸資買賣超張數', 0)) if not pd.isna(row.get('外陸資買賣超張數')) else 0,
-                    float(row.get('投信買賣超張數', 0)) if not pd.isna(row.get('投信買賣超張數')) else 0,
-                    float(row.get('自營商買賣超張數', 0)) if not pd.isna(row.get('自營商買賣超張數')) else 0,
-                    action, risk_level, score, summary, signals, update_time, is_focus
-                ))
-                total_records += 1
+            # 判斷是否為 focus 股票
+            is_focus = 1 if (focus_stock_codes and code in focus_stock_codes) else 0
+            
+            # 以整欄轉換取代逐列 iterrows，組成一批資料列再以 executemany 一次寫入
+            # 日期統一為 YYYY.MM.DD（無法解析的保留原字串）；歷史資料不進行分析，分析欄位留空
+            raw_dates = stock_df.attrs.get('原始日期', stock_df['日期'])
+            date_strs = stock_df['日期'].dt.strftime('%Y.%m.%d').fillna(raw_dates.astype(str)).tolist()
+            rows = list(zip(
+                repeat(code), repeat(name), repeat(type_str), repeat(sector), date_strs,
+                hot_db_float_values(stock_df, '開盤價'),
+                hot_db_float_values(stock_df, '最高價'),
+                hot_db_float_values(stock_df, '最低價'),
+                hot_db_float_values(stock_df, '收盤價'),
+                hot_db_int_values(stock_df, '成交張數'),
+                hot_db_text_values(stock_df, '成交筆數'),
+                hot_db_text_values(stock_df, '成交金額'),
+                hot_db_text_values(stock_df, '本益比'),
+                hot_db_float_values(stock_df, '外陸資買賣超張數'),
+                hot_db_float_values(stock_df, '投信買賣超張數'),
+                hot_db_float_values(stock_df, '自營商買賣超張數'),
+                repeat(''), repeat(''), repeat(0), repeat(''), repeat('[]'), repeat(update_time), repeat(is_focus)
+            ))
+            
+            # 對於最後一天的資料，附加量價分析結果
+            if analysis:
+                rows[-1] = rows[-1][:16] + (
+                    analysis['action'], analysis['risk_level'], analysis.get('score', 0),
+                    analysis.get('summary', ''), json.dumps(analysis.get('signals', []), ensure_ascii=False),
+                    update_time, is_focus
+                )
+            
+            cursor.executemany(insert_sql, rows)
+            total_records += len(rows)
         
         conn.commit()
-        conn.close()
         
         if is_first_stage:
             print(f"\n✅ 第一階段：已保存 {len(results)} 檔股票（共 {total_records} 筆交易記錄）到 {db_path}")
@@ -1558,22 +1112,42 @@ def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=Non
         
     except Exception as e:
         print(f"\n❌ 保存到資料庫失敗: {e}\n")
-        import traceback
         traceback.print_exc()
+        # 放棄未完成的交易，讓下一階段仍可沿用同一條連線
+        conn = HOT_DB_CONNECTIONS.get(HOT_DB_PATH)
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
         return False
 
+def close_hot_db_connection():
+    """關閉 stock_hot.db 的共用連線，解除獨佔鎖定讓其他程式可以讀取"""
+    conn = HOT_DB_CONNECTIONS.pop(HOT_DB_PATH, None)
+    if conn is not None:
+        conn.close()
+
 # ==============================
 # 🎯 主程式 - 兩階段執行
 # ==============================
 def main():
+    try:
+        run_two_stages()
+    finally:
+        close_hot_db_connection()
+
+def run_two_stages():
+    """第一階段掃描全部股票、第二階段處理追蹤清單（由 main 呼叫）"""
     # 檢查資料庫檔案是否存在
     if not Path(DB_TSE_PATH).exists() and not Path(DB_OTC_PATH).exists():
         print(f"❌ 找不到資料庫檔案：{DB_TSE_PATH} 或 {DB_OTC_PATH}")
         return
+    
+    # 來源資料庫加上查詢用索引（已存在則略過）
+    ensure_indexes([DB_TSE_PATH, DB_OTC_PATH])
 
     # 建立輸出資料夾
     base_output_folder = Path(OUTPUT_CHARTS_FOLDER)
     base_output_folder.mkdir(exist_ok=True)
+    write_plotlyjs_bundle(base_output_folder)
     
     # 加載公司資訊
     company_info = load_company_lists()
@@ -1582,23 +1156,19 @@ def main():
     latest_date_str = None
     try:
         if Path(DB_TSE_PATH).exists():
-            conn = sqlite3.connect(DB_TSE_PATH)
-            cursor = conn.cursor()
+            cursor = get_db_connection(DB_TSE_PATH).cursor()
             cursor.execute("SELECT MAX(日期) FROM stock_data")
             result = cursor.fetchone()
             if result and result[0]:
                 latest_date = pd.to_datetime(result[0])
                 latest_date_str = latest_date.strftime('%Y.%m.%d')
-            conn.close()
         
         if latest_date_str:
             print(f"📅 最新資料日期: {latest_date_str}")
         else:
-            from datetime import datetime
             latest_date_str = datetime.now().strftime('%Y.%m.%d')
     except Exception as e:
         print(f"⚠️ 無法讀取日期，使用當前日期: {e}")
-        from datetime import datetime
         latest_date_str = datetime.now().strftime('%Y.%m.%d')
     
     # 建立以日期命名的子資料夾
@@ -1640,10 +1210,13 @@ def main():
     print(f"   • 啟用條件: {' + '.join(enabled) if enabled else '無'}")
     print(f"   • 圖表篩選: 只生成「上車」建議的股票\n")
 
+    # 一次載入所有股票資料，避免逐檔查詢資料庫
+    all_stocks = load_all_stocks()
+
     # 篩選符合條件的股票
     results = []
     for stock_code in stock_codes:
-        res = analyze_stock(stock_code)
+        res = analyze_stock(stock_code, stock_df=all_stocks.get(stock_code))
         if res:
             results.append(res)
 
@@ -1657,45 +1230,57 @@ def main():
         print(f"✅ 找到 {len(results)} 檔符合基本條件，將進一步篩選「上車」建議：\n")
         
         chart_count = 0
-        for r in results:
-            code = r['code']
-            all_codes_stage1.add(code)
-            info = company_info.get(code, {})
-            name = info.get('name', '未知')
-            type_str = info.get('type', '未知')
-            sector = info.get('sector', '未知')
-
-            print(f"{code} | {name} | {type_str} | {sector} | 日期: {r['latest_date']} | 收盤: {r['latest_close']:.2f}")
-            if 'last_volume' in r:
-                print(f"    ▲ 成交量: {r['last_volume']:,} 張 (前高 {r['max_prev_volume']:,}, {r['multiple']}x)")
-            if 'closes' in r:
-                c = r['closes']
-                print(f"    📈 紅三兵: {c[0]} → {c[1]} → {c[2]}")
-            if 'net_summary' in r:
-                summary = r['net_summary']
-                print(f"    💰 三大法人合計買超（外/投/自 → 合計）：")
-                for i, (f, t, d, total) in enumerate(summary['details'], start=1):
-                    sign = "🔴" if total <= 0 else "🟢"
-                    print(f"        第{i}天： {int(f):>3} / {int(t):>3} / {int(d):>3} → {int(total):>+6} 張 {sign}")
-                print(f"        ▸ 合計 >0 天數：{summary['positive_days']}/3")
+        # 先逐檔完成量價分析，需要圖表的交給多個行程平行生成；之後再依原本順序輸出
+        plans = []
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_chart_worker) as chart_pool:
+            for r in results:
+                code = r['code']
+                all_codes_stage1.add(code)
+                info = company_info.get(code, {})
+                name = info.get('name', '未知')
+                type_str = info.get('type', '未知')
+                sector = info.get('sector', '未知')
+                
+                # 執行量價分析，只生成「上車」建議的圖表
+                analysis = None
+                future = None
+                stock_df = read_stock_from_db(code)
+                if stock_df is not None and len(stock_df) >= 10:
+                    analysis = analyze_volume_price_pattern(stock_df)
+                    if analysis['action'] in ['上車', '重倉', '觀望']:
+                        future = chart_pool.submit(generate_chart_job, generate_stock_chart,
+                                                   (code, name, None, output_folder, type_str, sector))
+                plans.append((r, name, type_str, sector, analysis, future))
             
-            # 執行量價分析，只生成「上車」建議的圖表
-            stock_df = read_stock_from_db(code)
-            if stock_df is not None and len(stock_df) >= 10:
-                analysis = analyze_volume_price_pattern(stock_df)
-                action = analysis['action']
-                print(f"    📊 量價分析: {action}")
+            for r, name, type_str, sector, analysis, future in plans:
+                code = r['code']
+                print(f"{code} | {name} | {type_str} | {sector} | 日期: {r['latest_date']} | 收盤: {r['latest_close']:.2f}")
+                if 'last_volume' in r:
+                    print(f"    ▲ 成交量: {r['last_volume']:,} 張 (前高 {r['max_prev_volume']:,}, {r['multiple']}x)")
+                if 'closes' in r:
+                    c = r['closes']
+                    print(f"    📈 紅三兵: {c[0]} → {c[1]} → {c[2]}")
+                if 'net_summary' in r:
+                    summary = r['net_summary']
+                    print(f"    💰 三大法人合計買超（外/投/自 → 合計）：")
+                    for i, (f, t, d, total) in enumerate(summary['details'], start=1):
+                        sign = "🔴" if total <= 0 else "🟢"
+                        print(f"        第{i}天： {int(f):>3} / {int(t):>3} / {int(d):>3} → {int(total):>+6} 張 {sign}")
+                    print(f"        ▸ 合計 >0 天數：{summary['positive_days']}/3")
                 
-                if action in ['上車', '重倉', '觀望']:
-                    print(f"    🎨 生成圖表...")
-                    if generate_stock_chart(code, name, None, output_folder, type_str, sector):
-                        chart_count += 1
+                if analysis is not None:
+                    print(f"    📊 量價分析: {analysis['action']}")
+                    
+                    if future is not None:
+                        print(f"    🎨 生成圖表...")
+                        if finish_chart_job(future):
+                            chart_count += 1
+                    else:
+                        print(f"    ⏭️  跳過（不是上車建議）")
                 else:
-                    print(f"    ⏭️  跳過（不是上車建議）")
-            else:
-                print(f"    ⚠️  資料不足，無法分析")
-            
-            print()
+                    print(f"    ⚠️  資料不足，無法分析")
+                
+                print()
         
         # 保存到資料庫（第一階段，創建全新資料庫）
         save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes, is_first_stage=True)
@@ -1733,73 +1318,87 @@ def main():
         else:
             print(f"📋 讀取到 {deduplicated_count} 檔追蹤股票\n")
         
+        # 一次比對整欄代碼，標出第一階段已處理過的股票
+        focus_codes = focus_df['股票代碼'].astype(str)
+        in_stage1 = focus_codes.isin(all_codes_stage1).to_numpy()
+        
         chart_count = 0
         skipped_count = 0
         results_stage2 = []  # 收集第二階段的結果
         
-        for idx, row in focus_df.iterrows():
-            industry = row['產業分類']
-            code = str(row['股票代碼'])
-            name = row['股票名稱']
-            category = row['領域分類'] if '領域分類' in row else ''
-            
-            # 過濾重複：如果這支股票在第一階段已處理，跳過
-            if code in all_codes_stage1:
-                print(f"⏭️  [{idx+1}/{len(focus_df)}] {industry} | {code} {name} - 已在第一階段處理，跳過")
-                skipped_count += 1
-                print()
-                continue
-            
-            print(f"📊 [{idx+1}/{len(focus_df)}] {industry} | {code} {name}")
-            
-            # 從資料庫讀取資料
-            stock_df = read_stock_from_db(code)
-            if stock_df is None or len(stock_df) == 0:
-                print(f"    ⚠️ 資料庫中無資料\n")
-                continue
+        # 只對未處理過的股票完成量價分析並把圖表交給多個行程平行生成，之後再依原本順序輸出
+        plans = {}
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_chart_worker) as chart_pool:
+            for idx, row in focus_df.loc[~in_stage1].iterrows():
+                code = str(row['股票代碼'])
+                
+                analysis = None
+                future = None
+                # 從資料庫讀取資料
+                stock_df = read_stock_from_db(code)
+                if stock_df is not None and len(stock_df) >= 10:
+                    # 執行量價分析，生成圖表（檔名格式與第一階段一致）
+                    analysis = analyze_volume_price_pattern(stock_df)
+                    type_str = company_info.get(code, {}).get('type', '未知')
+                    sector = company_info.get(code, {}).get('sector', '未知')
+                    future = chart_pool.submit(generate_chart_job, generate_stock_chart,
+                                               (code, row['股票名稱'], None, output_folder, type_str, sector))
+                plans[idx] = (stock_df, analysis, future)
             
-            # 執行量價分析
-            if len(stock_df) >= 10:
-                analysis = analyze_volume_price_pattern(stock_df)
-                action = analysis['action']
-                risk_level = analysis['risk_level']
-                score = analysis.get('score', 0)
+            for (idx, row), code, skipped in zip(focus_df.iterrows(), focus_codes, in_stage1):
+                industry = row['產業分類']
+                name = row['股票名稱']
                 
-                print(f"    📊 量價分析: {action} | 風險: {risk_level} | 評分: {score}")
-                print(f"    💡 {analysis['summary']}")
+                # 過濾重複：如果這支股票在第一階段已處理，跳過
+                if skipped:
+                    print(f"⏭️  [{idx+1}/{len(focus_df)}] {industry} | {code} {name} - 已在第一階段處理，跳過")
+                    skipped_count += 1
+                    print()
+                    continue
                 
-                # 生成圖表（檔名格式與第一階段一致）
-                type_str = company_info.get(code, {}).get('type', '未知')
-                sector = company_info.get(code, {}).get('sector', '未知')
+                stock_df, analysis, future = plans[idx]
                 
-                print(f"    🎨 生成圖表...")
-                if generate_stock_chart(code, name, None, output_folder, type_str, sector):
-                    chart_count += 1
-                    
-                    # 收集資料用於保存到資料庫
-                    # 確保數據類型正確
-                    stock_df_copy = stock_df.copy()
-                    for col in ['收盤價', '成交張數']:
-                        if col in stock_df_copy.columns:
-                            stock_df_copy[col] = stock_df_copy[col].astype(str).str.replace(',', '', regex=False)
-                            stock_df_copy[col] = pd.to_numeric(stock_df_copy[col], errors='coerce')
-                    
-                    stock_df_copy['日期'] = pd.to_datetime(stock_df_copy['日期'], errors='coerce')
+                print(f"📊 [{idx+1}/{len(focus_df)}] {industry} | {code} {name}")
+                
+                if stock_df is None or len(stock_df) == 0:
+                    print(f"    ⚠️ 資料庫中無資料\n")
+                    continue
+                
+                if analysis is not None:
+                    action = analysis['action']
+                    risk_level = analysis['risk_level']
+                    score = analysis.get('score', 0)
                     
-                    latest_close = stock_df_copy['收盤價'].iloc[-1] if '收盤價' in stock_df_copy.columns else 0
-                    last_volume = stock_df_copy['成交張數'].iloc[-1] if '成交張數' in stock_df_copy.columns else 0
-                    latest_date = stock_df_copy['日期'].iloc[-1] if '日期' in stock_df_copy.columns else pd.Timestamp(latest_date_str)
+                    print(f"    📊 量價分析: {action} | 風險: {risk_level} | 評分: {score}")
+                    print(f"    💡 {analysis['summary']}")
                     
-                    results_stage2.append({
-                        'code': code,
-                        'latest_date': latest_date.strftime('%Y-%m-%d') if isinstance(latest_date, pd.Timestamp) else latest_date_str,
-                        'latest_close': float(latest_close) if not pd.isna(latest_close) else 0,
-                        'last_volume': int(last_volume) if not pd.isna(last_volume) else 0
-                    })
-            else:
-                print(f"    ⚠️ 資料不足，無法分析")
-            
-            print()
+                    print(f"    🎨 生成圖表...")
+                    if finish_chart_job(future):
+                        chart_count += 1
+                        
+                        # 收集資料用於保存到資料庫
+                        # 確保數據類型正確
+                        stock_df_copy = stock_df.copy()
+                        for col in ['收盤價', '成交張數']:
+                            if col in stock_df_copy.columns:
+                                stock_df_copy[col] = clean_numeric(stock_df_copy[col])
+                        
+                        stock_df_copy['日期'] = pd.to_datetime(stock_df_copy['日期'], errors='coerce')
+                        
+                        latest_close = stock_df_copy['收盤價'].iloc[-1] if '收盤價' in stock_df_copy.columns else 0
+                        last_volume = stock_df_copy['成交張數'].iloc[-1] if '成交張數' in stock_df_copy.columns else 0
+                        latest_date = stock_df_copy['日期'].iloc[-1] if '日期' in stock_df_copy.columns else pd.Timestamp(latest_date_str)
+                        
+                        results_stage2.append({
+                            'code': code,
+                            'latest_date': latest_date.strftime('%Y-%m-%d') if isinstance(latest_date, pd.Timestamp) else latest_date_str,
+                            'latest_close': float(latest_close) if not pd.isna(latest_close) else 0,
+                            'last_volume': int(last_volume) if not pd.isna(last_volume) else 0
+                        })
+                else:
+                    print(f"    ⚠️ 資料不足，無法分析")
+                
+                print()
         
         # 保存第二階段資料到資料庫（追加模式）
         if results_stage2:
@@ -1814,7 +1413,6 @@ def main():
         
     except Exception as e:
         print(f"❌ 讀取追蹤清單失敗: {e}")
-        import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
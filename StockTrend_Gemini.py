@@ -1,11 +1,25 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import os
+import io
+import sys
 import sqlite3
 import json
+import traceback
+from datetime import datetime
+from collections import namedtuple
+from itertools import repeat
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from numba import njit
+from stock_common import (
+    get_db_connection, ensure_indexes,
+    CHART_FONT_FAMILY, CHART_TICK_DAYS, CHART_PAGE_TEMPLATE, ACTION_COLORS, RISK_COLORS, ANALYSIS_BLOCK_TEMPLATE,
+    moving_average, get_chart_base_layout, write_plotlyjs_bundle, chart_to_html,
+    init_chart_worker, generate_chart_job, finish_chart_job,
+    hot_db_float_values, hot_db_int_values, hot_db_text_values
+)
 
 # ==============================
 # 🔧 【可控制的參數設定】
@@ -39,35 +53,52 @@ MA_LONG = 20                # 中期均線天數
 
 # 輸出控制
 OUTPUT_CSV = False          # 是否輸出CSV檔案
+GENERATE_WATCH_CHARTS = False  # 不符合篩選條件（觀望）的股票是否仍生成圖表
+
+# 需要移除千位分隔符並轉為數值的欄位
+NUMERIC_COLUMNS = ['開盤價', '最高價', '最低價', '收盤價', '成交張數',
+                   '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']
+
+# 單檔查詢語句（參數化，SQLite 可重複使用已編譯的語句）
+STOCK_QUERY = "SELECT * FROM stock_data WHERE 股票代碼 = ? AND 日期 IS NOT NULL ORDER BY 日期"
 
 # ==============================
 # 📊 資料庫讀取函數
 # ==============================
+def clean_numeric(series):
+    """移除千位分隔符逗號並轉為數值；已是數值型態的欄位原樣回傳，不再重複轉換"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    # SQLite 同一欄可能混有數字與字串，逐值轉成字串再去逗號
+    cleaned = [str(v).replace(',', '') for v in series.to_numpy()]
+    return pd.Series(pd.to_numeric(cleaned, errors='coerce'), index=series.index, name=series.name)
+
+def clean_numeric_columns(df, columns=NUMERIC_COLUMNS):
+    """將數值欄位轉換一次（讀取資料庫時即完成，之後重複呼叫不會再轉換）"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = clean_numeric(df[col])
+    return df
+
 def read_stock_from_db(stock_code):
-    """從資料庫讀取指定股票的資料"""
+    """從資料庫讀取指定股票的資料（數值欄位已轉換）"""
     df = None
     
     # 先從上市資料庫查詢
     if Path(DB_TSE_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_TSE_PATH)
-            query = f"SELECT * FROM stock_data WHERE 股票代碼 = '{stock_code}' ORDER BY 日期"
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            df = pd.read_sql_query(STOCK_QUERY, get_db_connection(DB_TSE_PATH), params=(stock_code,))
             if len(df) > 0:
-                return df
+                return clean_numeric_columns(df)
         except:
             pass
     
     # 如果上市找不到，從上櫃資料庫查詢
     if Path(DB_OTC_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_OTC_PATH)
-            query = f"SELECT * FROM stock_data WHERE 股票代碼 = '{stock_code}' ORDER BY 日期"
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            df = pd.read_sql_query(STOCK_QUERY, get_db_connection(DB_OTC_PATH), params=(stock_code,))
             if len(df) > 0:
-                return df
+                return clean_numeric_columns(df)
         except:
             pass
     
@@ -79,21 +110,17 @@ def get_all_stock_codes():
     
     if Path(DB_TSE_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_TSE_PATH)
-            cursor = conn.cursor()
+            cursor = get_db_connection(DB_TSE_PATH).cursor()
             cursor.execute("SELECT DISTINCT 股票代碼 FROM stock_data")
             codes.update([str(row[0]) for row in cursor.fetchall()])
-            conn.close()
         except:
             pass
     
     if Path(DB_OTC_PATH).exists():
         try:
-            conn = sqlite3.connect(DB_OTC_PATH)
-            cursor = conn.cursor()
+            cursor = get_db_connection(DB_OTC_PATH).cursor()
             cursor.execute("SELECT DISTINCT 股票代碼 FROM stock_data")
             codes.update([str(row[0]) for row in cursor.fetchall()])
-            conn.close()
         except:
             pass
     
@@ -102,9 +129,114 @@ def get_all_stock_codes():
     
     return sorted(filtered_codes)
 
+def load_all_stocks():
+    """
+    一次讀取上市、上櫃資料庫的全部資料並依股票代碼分組，取代逐檔查詢
+    回傳 {股票代碼: DataFrame}（原始資料，依日期排序）；與 read_stock_from_db 相同，上市資料優先
+    """
+    all_stocks = {}
+    
+    # 先讀上櫃再讀上市，讓同代碼時由上市資料覆蓋
+    for db_path in [DB_OTC_PATH, DB_TSE_PATH]:
+        if not Path(db_path).exists():
+            continue
+        try:
+            df = pd.read_sql_query("SELECT * FROM stock_data ORDER BY 股票代碼, 日期", get_db_connection(db_path))
+        except:
+            continue
+        
+        # 整張表一次完成數值轉換，之後各檔不必再逐檔轉換
+        clean_numeric_columns(df)
+        
+        for code, group in df.groupby('股票代碼', sort=False):
+            all_stocks[str(code)] = group.reset_index(drop=True)
+    
+    return all_stocks
+
 # ==============================
 # 📈 【唯一分析引擎】screen_stocks
 # ==============================
+@njit(cache=True)
+def trailing_mean(values, window):
+    """
+    只計算最後一個視窗的平均（等同 rolling(window).mean() 的最後一個值）
+    資料不足一個視窗或視窗內有 NaN 時回傳 NaN
+    """
+    n = len(values)
+    if n < window:
+        return np.nan
+    total = 0.0
+    for i in range(n - window, n):
+        total += values[i]
+    return total / window
+
+@njit(cache=True)
+def eval_screen_conditions(close, volume, open_price, high, low, inst_total,
+                           use_price, use_ma, use_vol, use_min_vol, use_inst, use_shape,
+                           max_price, vol_ratio_limit, min_volume, shadow_limit, ma_short, ma_long):
+    """
+    screen_stocks 的條件判斷核心（Numba 編譯），只用到最新一天與均線視窗內的資料
+    依成本由低到高判斷：只看最新一天的條件在前，需要掃描視窗的均線條件在後，遇到不符合的就停止
+    回傳 (是否符合全部條件, 量能倍數, 上影線比例)；不符合時比例不一定有計算，以 NaN 表示
+    """
+    n = len(close)
+    latest_close = close[n - 1]
+    latest_volume = volume[n - 1]
+    
+    # 價格條件
+    if use_price and not latest_close <= max_price:
+        return False, np.nan, np.nan
+    
+    # 最低成交量
+    if use_min_vol and not latest_volume >= min_volume:
+        return False, np.nan, np.nan
+    
+    # 法人籌碼 (外資+投信+自營商合計買超)
+    if use_inst and not inst_total > 0:
+        return False, np.nan, np.nan
+    
+    # K線型態 (避免追高受阻留長上影線)
+    latest_open = open_price[n - 1]
+    candle_range = high[n - 1] - low[n - 1]
+    candle_top = latest_close if latest_close > latest_open else latest_open
+    upper_shadow = high[n - 1] - candle_top
+    actual_shadow_ratio = upper_shadow / (candle_range + 0.01)
+    if use_shape and not actual_shadow_ratio <= shadow_limit:
+        return False, np.nan, actual_shadow_ratio
+    
+    # 量能爆發
+    vol_ma = trailing_mean(volume, ma_short)
+    actual_vol_ratio = latest_volume / vol_ma if vol_ma != 0 else 0.0
+    if use_vol and not actual_vol_ratio >= vol_ratio_limit:
+        return False, actual_vol_ratio, actual_shadow_ratio
+    
+    # 均線趨勢 (收盤 > 短均 > 長均)
+    if use_ma and not (latest_close > trailing_mean(close, ma_short) > trailing_mean(close, ma_long)):
+        return False, actual_vol_ratio, actual_shadow_ratio
+    
+    return True, actual_vol_ratio, actual_shadow_ratio
+
+@njit(cache=True)
+def eval_screen_conditions_grouped(close, volume, open_price, high, low, foreign, trust, dealer, starts, ends,
+                                   use_price, use_ma, use_vol, use_min_vol, use_inst, use_shape,
+                                   max_price, vol_ratio_limit, min_volume, shadow_limit, ma_short, ma_long):
+    """
+    對多檔股票接在一起的陣列逐段執行 eval_screen_conditions（第 g 檔為 starts[g]:ends[g]）
+    資料筆數不足 ma_long 的股票視為不符合；回傳每檔是否符合全部條件的布林陣列
+    """
+    passed = np.zeros(len(starts), dtype=np.bool_)
+    for g in range(len(starts)):
+        s, e = starts[g], ends[g]
+        if e - s < ma_long:
+            continue
+        inst_total = foreign[e - 1] + trust[e - 1] + dealer[e - 1]
+        passed[g] = eval_screen_conditions(
+            close[s:e], volume[s:e], open_price[s:e], high[s:e], low[s:e], inst_total,
+            use_price, use_ma, use_vol, use_min_vol, use_inst, use_shape,
+            max_price, vol_ratio_limit, min_volume, shadow_limit, ma_short, ma_long
+        )[0]
+    return passed
+
 def screen_stocks(df, 
                   # --- 條件開關 (Flags) ---
                   use_price=True,   # 是否過濾股價上限
@@ -142,62 +274,43 @@ def screen_stocks(df,
         df['日期'] = pd.to_datetime(df['日期'])
         df = df.sort_values('日期').reset_index(drop=True)
         
-        # 移除千位分隔符並轉換數值
-        for col in ['收盤價', '開盤價', '最高價', '最低價', '成交張數', 
-                    '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # 移除千位分隔符並轉換數值（已是數值的欄位直接略過）
+        clean_numeric_columns(df)
         
         if len(df) < ma_long: 
             return None
             
-        df['MA_S'] = df['收盤價'].rolling(window=ma_short).mean()
-        df['MA_L'] = df['收盤價'].rolling(window=ma_long).mean()
-        df['MA20'] = df['收盤價'].rolling(window=20).mean()
-        df['MA60'] = df['收盤價'].rolling(window=60).mean()
-        df['VolMA'] = df['成交張數'].rolling(window=ma_short).mean()
-        
-        latest = df.iloc[-1]
-        prev = df.iloc[-2]
-        
-        # 2. 條件判斷邏輯 (若 Flag 為 False，則該條件恆為 True)
-        
-        # 價格條件
-        c_price = (latest['收盤價'] <= max_price) if use_price else True
-        
-        # 均線趨勢 (收盤 > 短均 > 長均)
-        c_ma = (latest['收盤價'] > latest['MA_S'] > latest['MA_L']) if use_ma else True
-        
-        # 量能爆發
-        actual_vol_ratio = latest['成交張數'] / latest['VolMA'] if latest['VolMA'] != 0 else 0
-        c_vol = (actual_vol_ratio >= vol_ratio_limit) if use_vol else True
-        
-        # 最低成交量
-        c_min_vol = (latest['成交張數'] >= min_volume) if use_min_vol else True
-        
-        # 法人籌碼 (外資+投信+自營商合計買超)
-        inst_total = latest['外陸資買賣超張數'] + latest['投信買賣超張數'] + latest['自營商買賣超張數']
-        c_inst = (inst_total > 0) if use_inst else True
-        
-        # K線型態 (避免追高受阻留長上影線)
-        candle_range = latest['最高價'] - latest['最低價']
-        upper_shadow = latest['最高價'] - max(latest['開盤價'], latest['收盤價'])
-        actual_shadow_ratio = upper_shadow / (candle_range + 0.01)
-        c_shape = (actual_shadow_ratio <= shadow_limit) if use_shape else True
+        # 只取最後一個視窗的均線，交給 Numba 核心一次判斷全部條件（不再為整段資料建立 rolling 欄位）
+        close = df['收盤價'].to_numpy(dtype=np.float64)
+        inst_total = df['外陸資買賣超張數'].iat[-1] + df['投信買賣超張數'].iat[-1] + df['自營商買賣超張數'].iat[-1]
+        passed, actual_vol_ratio, actual_shadow_ratio = eval_screen_conditions(
+            close,
+            df['成交張數'].to_numpy(dtype=np.float64),
+            df['開盤價'].to_numpy(dtype=np.float64),
+            df['最高價'].to_numpy(dtype=np.float64),
+            df['最低價'].to_numpy(dtype=np.float64),
+            float(inst_total),
+            use_price, use_ma, use_vol, use_min_vol, use_inst, use_shape,
+            float(max_price), float(vol_ratio_limit), float(min_volume), float(shadow_limit),
+            ma_short, ma_long
+        )
         
         # 3. 綜合判定
-        if all([c_price, c_ma, c_vol, c_min_vol, c_inst, c_shape]):
+        if passed:
+            latest_close = df['收盤價'].iat[-1]
+            prev_close = df['收盤價'].iat[-2]
+            stock_code = df['股票代碼'].iat[-1]
+            stock_name = df['股票名稱'].iat[-1]
             return {
-                "股票": f"{latest['股票代碼']} {latest['股票名稱']}",
-                "收盤價": latest['收盤價'],
-                "漲跌幅": f"{round(((latest['收盤價']-prev['收盤價'])/prev['收盤價'])*100, 2)}%",
+                "股票": f"{stock_code} {stock_name}",
+                "收盤價": latest_close,
+                "漲跌幅": f"{round(((latest_close-prev_close)/prev_close)*100, 2)}%",
                 "量能倍數": round(actual_vol_ratio, 2),
                 "法人買超張數": inst_total,
                 "上影線比例": f"{round(actual_shadow_ratio*100, 1)}%",
-                "latest_date": latest['日期'].strftime('%Y.%m.%d'),
-                "stock_code": latest['股票代碼'],
-                "stock_name": latest['股票名稱']
+                "latest_date": df['日期'].iat[-1].strftime('%Y.%m.%d'),
+                "stock_code": stock_code,
+                "stock_name": stock_name
             }
         return None
         
@@ -205,14 +318,73 @@ def screen_stocks(df,
         print(f"處理股票時出錯: {e}")
         return None
 
+def screen_all_stocks(all_stocks, stock_codes,
+                      use_price=True, use_ma=True, use_vol=True, use_min_vol=True, use_inst=True, use_shape=True,
+                      max_price=100.0, vol_ratio_limit=1.2, min_volume=5000, shadow_limit=0.2,
+                      ma_short=5, ma_long=20):
+    """
+    全市場一次篩選：把 load_all_stocks 的各檔資料接成一張表，交給 Numba 核心一次判斷全部股票
+    只有符合條件的少數股票再以 screen_stocks 產生完整結果，條件與參數與 screen_stocks 相同
+    日期無法解析或缺少欄位的股票不經 Numba 核心，直接交給 screen_stocks 逐檔處理（出錯時回報並略過）
+    回傳 [(股票代碼, screen_stocks 結果)]，順序與 stock_codes 相同
+    """
+    codes = [code for code in stock_codes if all_stocks.get(code) is not None and len(all_stocks[code]) > 0]
+    if not codes:
+        return []
+    
+    big = pd.concat([all_stocks[code] for code in codes], ignore_index=True)
+    lengths = np.array([len(all_stocks[code]) for code in codes])
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    group_ids = np.repeat(np.arange(len(codes)), lengths)
+    
+    try:
+        # 資料庫的日期是文字，文字順序不一定是日期順序：與 screen_stocks 相同，解析後在各檔內依日期排序
+        dates = pd.to_datetime(big['日期'], errors='coerce').to_numpy()
+        order = np.lexsort((dates, group_ids))
+        columns = [big[col].to_numpy(dtype=np.float64)[order] for col in
+                   ['收盤價', '成交張數', '開盤價', '最高價', '最低價', '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']]
+    except (KeyError, ValueError, TypeError):
+        # 缺少欄位或欄位無法轉為數值：全部改為逐檔判斷
+        candidates = np.ones(len(codes), dtype=np.bool_)
+    else:
+        candidates = eval_screen_conditions_grouped(
+            *columns,
+            starts, ends,
+            use_price, use_ma, use_vol, use_min_vol, use_inst, use_shape,
+            float(max_price), float(vol_ratio_limit), float(min_volume), float(shadow_limit),
+            ma_short, ma_long
+        )
+        # 含無法解析日期的股票排序結果不可靠，交給 screen_stocks 逐檔判斷
+        bad_dates = np.zeros(len(codes), dtype=np.bool_)
+        np.logical_or.at(bad_dates, group_ids, np.isnat(dates))
+        candidates |= bad_dates
+    
+    results = []
+    for code in np.array(codes, dtype=object)[candidates]:
+        res = screen_stocks(
+            all_stocks[code],
+            use_price=use_price, use_ma=use_ma, use_vol=use_vol, use_min_vol=use_min_vol,
+            use_inst=use_inst, use_shape=use_shape,
+            max_price=max_price, vol_ratio_limit=vol_ratio_limit, min_volume=min_volume,
+            shadow_limit=shadow_limit, ma_short=ma_short, ma_long=ma_long
+        )
+        if res:
+            results.append((code, res))
+    return results
+
 # ==============================
 # 📚 載入公司資訊
 # ==============================
+# 公司資訊（以具名欄位存取，查無資料時統一使用 UNKNOWN_COMPANY）
+CompanyInfo = namedtuple('CompanyInfo', ['name', 'type', 'sector'])
+UNKNOWN_COMPANY = CompanyInfo('未知', '未知', '未知')
+
 def load_company_lists():
     """
     載入公司資訊 (上市/上櫃)
     回傳格式: {
-        'code': {'name': '公司名稱', 'type': '上市/上櫃', 'sector': '產業分類'}
+        'code': CompanyInfo(name='公司名稱', type='上市/上櫃', sector='產業分類')
     }
     """
     company_info = {}
@@ -229,12 +401,8 @@ def load_company_lists():
                     code = parts[0].strip()
                     name = parts[1].strip()
                     sector = parts[2].strip()
-                    company_info[code] = {
-                        'name': name,
-                        'type': '上市',
-                        'sector': sector
-                    }
-            print(f"✅ 讀取上市公司清單: {len([k for k, v in company_info.items() if v['type'] == '上市'])} 家")
+                    company_info[code] = CompanyInfo(name, '上市', sector)
+            print(f"✅ 讀取上市公司清單: {len([k for k, v in company_info.items() if v.type == '上市'])} 家")
         except Exception as e:
             print(f"⚠️ 讀取上市公司清單失敗: {e}")
     else:
@@ -252,12 +420,8 @@ def load_company_lists():
                     code = parts[0].strip()
                     name = parts[1].strip()
                     sector = parts[2].strip()
-                    company_info[code] = {
-                        'name': name,
-                        'type': '上櫃',
-                        'sector': sector
-                    }
-            print(f"✅ 讀取上櫃公司清單: {len([k for k, v in company_info.items() if v['type'] == '上櫃'])} 家")
+                    company_info[code] = CompanyInfo(name, '上櫃', sector)
+            print(f"✅ 讀取上櫃公司清單: {len([k for k, v in company_info.items() if v.type == '上櫃'])} 家")
         except Exception as e:
             print(f"⚠️ 讀取上櫃公司清單失敗: {e}")
     else:
@@ -268,11 +432,14 @@ def load_company_lists():
 # ==============================
 # 📈 生成單檔股票圖表
 # ==============================
-def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_type='未知', stock_sector='未知', industry_category=None):
-    """生成單檔股票的HTML圖表，先分析後命名"""
+def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_type='未知', stock_sector='未知', industry_category=None, df=None):
+    """生成單檔股票的HTML圖表，先分析後命名（df 為已讀入的資料時直接沿用，不再查詢資料庫）"""
     try:
         # 從資料庫讀取資料
-        df = read_stock_from_db(stock_code)
+        if df is None:
+            df = read_stock_from_db(stock_code)
+        else:
+            df = df.copy()
         if df is None or len(df) == 0:
             print(f"        ⚠️ 無法從資料庫讀取 {stock_code} {stock_name} 的資料")
             return False
@@ -280,15 +447,14 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         # 轉換資料類型
         df['日期'] = pd.to_datetime(df['日期'], errors='coerce')
         
-        # 移除千位分隔符逗號後再轉換數值
-        for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數',
-                    '外陸資買賣超張數', '投信買賣超張數', '自營商買賣超張數']:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(',', '', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # 移除千位分隔符逗號後再轉換數值（資料庫讀取時已轉換過的欄位會直接略過）
+        clean_numeric_columns(df)
         
-        df.dropna(subset=['日期'], inplace=True)
-        df.sort_values('日期', inplace=True)
+        # 查詢時已排除空日期並依日期排序，只有日期無法解析或順序不對時才需要再整理
+        if df['日期'].hasnans:
+            df = df.dropna(subset=['日期'])
+        if not df['日期'].is_monotonic_increasing:
+            df = df.sort_values('日期')
         
         # 取得最後一天收盤價
         latest_close = df['收盤價'].iloc[-1]
@@ -309,6 +475,11 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
             ma_long=MA_LONG
         )
         
+        # 觀望的股票不必畫圖，直接略過整段圖表與 HTML 生成
+        if not screen_result and not GENERATE_WATCH_CHARTS:
+            print(f"        ⏭️ {stock_code} {stock_name} 不符合篩選條件（觀望），略過圖表")
+            return False
+        
         # 轉換成原本 analyze_volume_price_pattern 的格式
         if screen_result:
             analysis = {
@@ -346,153 +517,136 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         
         output_path = output_folder / output_filename
         
-        # 取最近60筆資料
-        df_chart = df.tail(60).copy()
+        # 取最近60筆資料（只讀取，不新增欄位，因此不必複製）
+        df_chart = df.iloc[-60:]
+        close_arr = df_chart['收盤價'].to_numpy()
         
-        # 計算移動平均線
-        df_chart['MA5'] = df_chart['收盤價'].rolling(window=5, min_periods=1).mean()
-        df_chart['MA10'] = df_chart['收盤價'].rolling(window=10, min_periods=1).mean()
-        df_chart['MA20'] = df_chart['收盤價'].rolling(window=20, min_periods=1).mean()
-        df_chart['MA60'] = df_chart['收盤價'].rolling(window=60, min_periods=1).mean()
+        # 計算移動平均線（只用於繪圖，保留為區域陣列）
+        ma_arrs = {window: moving_average(close_arr, window) for window in [5, 10, 20, 60]}
         
-        # 創建子圖
-        fig = make_subplots(
-            rows=4, cols=1,
-            shared_xaxes=True,
-            vertical_spacing=0.03,
-            subplot_titles=('', '', '', ''),
-            row_heights=[0.4, 0.2, 0.2, 0.2],
-            specs=[[{"secondary_y": False}],
-                   [{"secondary_y": False}],
-                   [{"secondary_y": False}],
-                   [{"secondary_y": False}]]
-        )
+        dates = [d.isoformat() for d in df_chart['日期']]
+        
+        # 各層圖表直接以 dict 描述（版面共用 get_chart_base_layout 的快取，不再逐檔建立與驗證 plotly 物件）
+        traces = []
         
         # 第一層：K線圖
-        fig.add_trace(
-            go.Candlestick(
-                x=df_chart['日期'],
-                open=df_chart['開盤價'],
-                high=df_chart['最高價'],
-                low=df_chart['最低價'],
-                close=df_chart['收盤價'],
-                name='K線',
-                increasing_line_color='#FF5252',
-                increasing_fillcolor='#FF5252',
-                decreasing_line_color='#00C851',
-                decreasing_fillcolor='#00C851',
-                line=dict(width=0.8),
-            ),
-            row=1, col=1
-        )
+        traces.append(dict(
+            type='candlestick',
+            x=dates,
+            open=df_chart['開盤價'].to_numpy(),
+            high=df_chart['最高價'].to_numpy(),
+            low=df_chart['最低價'].to_numpy(),
+            close=close_arr,
+            name='K線',
+            increasing=dict(line=dict(color='#FF5252'), fillcolor='#FF5252'),
+            decreasing=dict(line=dict(color='#00C851'), fillcolor='#00C851'),
+            line=dict(width=0.8),
+            xaxis='x', yaxis='y'
+        ))
         
         # 添加MA5、MA10、MA20、MA60
-        for ma_name, ma_col, color in [
-            ('MA5', 'MA5', 'blue'), 
-            ('MA10', 'MA10', 'orange'),
-            ('MA20', 'MA20', 'green'),
-            ('MA60', 'MA60', 'purple')
+        for ma_name, window, color in [
+            ('MA5', 5, 'blue'), 
+            ('MA10', 10, 'orange'),
+            ('MA20', 20, 'green'),
+            ('MA60', 60, 'purple')
         ]:
-            if ma_col in df_chart.columns and df_chart[ma_col].notna().sum() > 0:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_chart['日期'],
-                        y=df_chart[ma_col],
-                        name=ma_name,
-                        line=dict(color=color, width=1.5),
-                        mode='lines',
-                    ),
-                    row=1, col=1
-                )
+            ma_arr = ma_arrs[window]
+            if (~np.isnan(ma_arr)).any():
+                traces.append(dict(
+                    type='scatter',
+                    x=dates,
+                    y=ma_arr,
+                    name=ma_name,
+                    line=dict(color=color, width=1.5),
+                    mode='lines',
+                    xaxis='x', yaxis='y'
+                ))
         
         # 第二層：成交量
         if '成交張數' in df_chart.columns:
-            volume_lots = pd.to_numeric(df_chart['成交張數'], errors='coerce')
-            colors = []
-            for i in range(len(df_chart)):
-                if i == 0:
-                    if df_chart['收盤價'].iloc[i] >= df_chart['開盤價'].iloc[i]:
-                        colors.append('rgba(255, 82, 82, 0.8)')
-                    else:
-                        colors.append('rgba(0, 200, 81, 0.8)')
-                else:
-                    if df_chart['收盤價'].iloc[i] >= df_chart['收盤價'].iloc[i-1]:
-                        colors.append('rgba(255, 82, 82, 0.8)')
-                    else:
-                        colors.append('rgba(0, 200, 81, 0.8)')
+            # 成交張數已在 clean_numeric_columns 轉換過，直接取出陣列
+            volume_lots = df_chart['成交張數'].to_numpy()
+            # 收盤價 >= 前一日收盤價（第一天與當日開盤價比較）為紅，否則為綠
+            prev_close = np.empty_like(close_arr)
+            prev_close[:1] = df_chart['開盤價'].to_numpy()[:1]
+            prev_close[1:] = close_arr[:-1]
+            colors = np.where(close_arr >= prev_close, 'rgba(255, 82, 82, 0.8)', 'rgba(0, 200, 81, 0.8)').tolist()
             
-            fig.add_trace(
-                go.Bar(
-                    x=df_chart['日期'],
-                    y=volume_lots,
-                    name='成交量',
-                    marker=dict(color=colors, line=dict(width=0)),
-                    showlegend=True
-                ),
-                row=2, col=1
-            )
+            traces.append(dict(
+                type='bar',
+                x=dates,
+                y=volume_lots,
+                name='成交量',
+                marker=dict(color=colors, line=dict(width=0)),
+                showlegend=True,
+                xaxis='x2', yaxis='y2'
+            ))
         
         # 第三層：三大法人當日買賣超
         has_institutional = False
         if '外陸資買賣超張數' in df_chart.columns:
-            foreign = pd.to_numeric(df_chart['外陸資買賣超張數'], errors='coerce')
-            trust = pd.to_numeric(df_chart.get('投信買賣超張數', 0), errors='coerce')
-            dealer = pd.to_numeric(df_chart.get('自營商買賣超張數', 0), errors='coerce')
+            # 數值欄位已在 clean_numeric_columns 轉換過，直接取出陣列；缺少的欄位視為無資料
+            missing = np.full(len(df_chart), np.nan)
+            foreign = df_chart['外陸資買賣超張數'].to_numpy(dtype=np.float64)
+            trust = df_chart['投信買賣超張數'].to_numpy(dtype=np.float64) if '投信買賣超張數' in df_chart.columns else missing
+            dealer = df_chart['自營商買賣超張數'].to_numpy(dtype=np.float64) if '自營商買賣超張數' in df_chart.columns else missing
             
-            if foreign.notna().sum() > 0 or trust.notna().sum() > 0 or dealer.notna().sum() > 0:
+            # 三者任一有資料就畫（一次 .any()，找到第一個有效值即可）
+            if (~(np.isnan(foreign) & np.isnan(trust) & np.isnan(dealer))).any():
                 has_institutional = True
                 for name, data, color in [
                     ('外資', foreign, 'rgba(255, 82, 82, 0.75)'),
                     ('投信', trust, 'rgba(0, 200, 81, 0.75)'),
                     ('自營商', dealer, 'rgba(0, 191, 255, 0.75)')
                 ]:
-                    fig.add_trace(
-                        go.Bar(
-                            x=df_chart['日期'],
-                            y=data,
-                            name=name,
-                            marker_color=color,
-                            legendgroup=name,
-                            showlegend=True
-                        ),
-                        row=3, col=1
-                    )
+                    traces.append(dict(
+                        type='bar',
+                        x=dates,
+                        y=data,
+                        name=name,
+                        marker=dict(color=color),
+                        legendgroup=name,
+                        showlegend=True,
+                        xaxis='x3', yaxis='y3'
+                    ))
         
         # 第四層：三大法人累積買賣超
         if has_institutional:
-            foreign_cumsum = pd.to_numeric(df_chart['外陸資買賣超張數'], errors='coerce').fillna(0).cumsum()
-            trust_cumsum = pd.to_numeric(df_chart.get('投信買賣超張數', 0), errors='coerce').fillna(0).cumsum()
-            dealer_cumsum = pd.to_numeric(df_chart.get('自營商買賣超張數', 0), errors='coerce').fillna(0).cumsum()
+            # 沿用上面已轉換的當日買賣超，三者疊成一個陣列一次做累積和
+            stacked = np.vstack([foreign, trust, dealer])
+            stacked[np.isnan(stacked)] = 0
+            foreign_cumsum, trust_cumsum, dealer_cumsum = np.cumsum(stacked, axis=1)
             
             for name, data, color in [
                 ('外資', foreign_cumsum, 'rgb(255, 82, 82)'),
                 ('投信', trust_cumsum, 'rgb(0, 200, 81)'),
                 ('自營商', dealer_cumsum, 'rgb(0, 191, 255)')
             ]:
-                fig.add_trace(
-                    go.Scatter(
-                        x=df_chart['日期'],
-                        y=data,
-                        name=f'{name}累積',
-                        line=dict(color=color, width=2.5, shape='spline', smoothing=0.8),
-                        mode='lines',
-                        legendgroup=name,
-                        showlegend=True
-                    ),
-                    row=4, col=1
-                )
+                traces.append(dict(
+                    type='scatter',
+                    x=dates,
+                    y=data,
+                    name=f'{name}累積',
+                    line=dict(color=color, width=2.5, shape='spline', smoothing=0.8),
+                    mode='lines',
+                    legendgroup=name,
+                    showlegend=True,
+                    xaxis='x4', yaxis='y4'
+                ))
         
         # 計算統計數據
-        latest = df_chart.iloc[-1]
-        latest_date_str = latest['日期'].strftime('%Y.%m.%d')
+        # 直接取最後一個值，不必把整列組成 Series
+        latest_date_str = df_chart['日期'].iat[-1].strftime('%Y.%m.%d')
+        latest_volume = df_chart['成交張數'].iat[-1] if '成交張數' in df_chart.columns else 0
         stats = {
-            '成交量': latest['成交張數'] if '成交張數' in latest and pd.notna(latest['成交張數']) else 0,
-            '外資累積': foreign_cumsum.iloc[-1] if has_institutional and len(foreign_cumsum) > 0 else 0,
-            '投信累積': trust_cumsum.iloc[-1] if has_institutional and len(trust_cumsum) > 0 else 0,
-            '自營累積': dealer_cumsum.iloc[-1] if has_institutional and len(dealer_cumsum) > 0 else 0,
+            '成交量': latest_volume if pd.notna(latest_volume) else 0,
+            '外資累積': foreign_cumsum[-1] if has_institutional and len(foreign_cumsum) > 0 else 0,
+            '投信累積': trust_cumsum[-1] if has_institutional and len(trust_cumsum) > 0 else 0,
+            '自營累積': dealer_cumsum[-1] if has_institutional and len(dealer_cumsum) > 0 else 0,
         }
         
-        # 更新佈局
+        # 更新佈局（只覆寫每檔不同的部分，共用版面本身不會被修改）
         stats_line1 = (
             f"最新資料日期: {latest_date_str} | "
             f"外資累積: {stats['外資累積']:,.0f}張 | "
@@ -501,32 +655,13 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         )
         stats_line2 = f"股價K線圖 | 成交量: {stats['成交量']:,.0f}張"
         
-        fig.update_layout(
-            title=dict(
-                text=f'{stock_code} {stock_name} ({stock_type} | {stock_sector}) 技術分析圖表 (最近60筆)<br><sub>{stats_line1}</sub><br><sub>{stats_line2}</sub>',
-                x=0.5,
-                xanchor='center',
-                font=dict(size=16, family='Microsoft JhengHei, Arial, sans-serif')
-            ),
-            xaxis_rangeslider_visible=False,
-            height=1500,
-            showlegend=True,
-            hovermode='x unified',
-            template='plotly_white',
-            barmode='relative',
-            legend=dict(
-                orientation="v",
-                yanchor="top",
-                y=0.98,
-                xanchor="left",
-                x=0.01,
-                bgcolor="rgba(255, 255, 255, 0.8)",
-                bordercolor="lightgray",
-                borderwidth=1,
-                font=dict(family='Microsoft JhengHei, Arial, sans-serif')
-            ),
-            font=dict(family='Microsoft JhengHei, Arial, sans-serif'),
-            dragmode='pan'
+        base_layout = get_chart_base_layout()
+        layout = dict(base_layout)
+        layout['title'] = dict(
+            text=f'{stock_code} {stock_name} ({stock_type} | {stock_sector}) 技術分析圖表 (最近60筆)<br><sub>{stats_line1}</sub><br><sub>{stats_line2}</sub>',
+            x=0.5,
+            xanchor='center',
+            font=dict(size=16, family=CHART_FONT_FAMILY)
         )
         
         # 更新Y軸
@@ -536,70 +671,29 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         price_margin = (price_max - price_min) * 0.05
         price_range = [price_min - price_margin, price_max + price_margin]
         
-        fig.update_yaxes(title_text="股價 (元)", row=1, col=1, range=price_range, fixedrange=True)
-        fig.update_yaxes(title_text="成交量 (張)", row=2, col=1, tickformat=",", fixedrange=True)
-        fig.update_yaxes(title_text="當日買賣超 (張)", row=3, col=1, tickformat=",", fixedrange=True)
-        fig.update_yaxes(title_text="累積買賣超 (張)", row=4, col=1, tickformat=",", fixedrange=True)
+        layout['yaxis'] = dict(base_layout['yaxis'], range=price_range)
         
         # 更新X軸 - 移除非交易日空隙
         start_date = df_chart['日期'].min()
         end_date = df_chart['日期'].max()
-        trading_dates = df_chart['日期'].tolist()
         
         # 生成刻度值（每月1、6、11、16、21、26日）
-        tickvals = []
-        current = start_date.replace(day=1)
-        while current <= end_date:
-            for day in [1, 6, 11, 16, 21, 26]:
-                try:
-                    tick_date = current.replace(day=day)
-                    if start_date <= tick_date <= end_date:
-                        tickvals.append(tick_date)
-                except:
-                    pass
-            if current.month == 12:
-                current = current.replace(year=current.year + 1, month=1)
-            else:
-                current = current.replace(month=current.month + 1)
+        all_days = pd.date_range(start=start_date, end=end_date, freq='D')
+        tickvals = [d.isoformat() for d in all_days[all_days.day.isin(CHART_TICK_DAYS)]]
         
-        for i in range(1, 5):
-            fig.update_xaxes(
-                tickformat="%m-%d",
-                tickangle=-45,
-                tickmode='array',
-                tickvals=tickvals,
-                showticklabels=True,
-                autorange=True,
-                hoverformat="%m-%d",
-                fixedrange=True,
-                rangebreaks=[
-                    dict(values=pd.date_range(start=start_date, end=end_date, freq='D')
-                         .difference(pd.DatetimeIndex(trading_dates)).tolist())
-                ],
-                row=i, col=1
-            )
+        # 非交易日：區間內每一天以 isin 比對交易日（不必再排序求差集），4 層子圖共用同一份 rangebreaks
+        non_trading = all_days[~all_days.isin(df_chart['日期'])]
+        rangebreaks = [dict(values=[d.isoformat() for d in non_trading])]
+        for axis in ['xaxis', 'xaxis2', 'xaxis3', 'xaxis4']:
+            layout[axis] = dict(base_layout[axis], tickvals=tickvals, rangebreaks=rangebreaks)
         
-        # 生成HTML
-        html_string = fig.to_html(include_plotlyjs='cdn')
+        # 生成HTML（資料已是純 dict，略過 plotly 的逐欄驗證）
+        html_string = chart_to_html(dict(data=traces, layout=layout))
         
         # 生成分析區塊的HTML
-        # 根據操作建議選擇顏色
-        action_colors = {
-            '重倉': '#FF4444',
-            '上車': '#00C851',
-            '觀望': '#FFA500',
-            '減倉': '#FF8800',
-            '清倉': '#CC0000'
-        }
-        action_color = action_colors.get(analysis['action'], '#666666')
-        
-        # 根據風險等級選擇顏色
-        risk_colors = {
-            '低': '#00C851',
-            '中': '#FFA500',
-            '高': '#FF4444'
-        }
-        risk_color = risk_colors.get(analysis['risk_level'], '#666666')
+        # 根據操作建議、風險等級選擇顏色
+        action_color = ACTION_COLORS.get(analysis['action'], '#666666')
+        risk_color = RISK_COLORS.get(analysis['risk_level'], '#666666')
         
         # 生成信號列表HTML
         signals_html = ""
@@ -626,91 +720,22 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         else:
             progress_color = '#FF4444'  # 紅色
         
-        analysis_block = f'''
-<div style="max-width: 1200px; margin: 30px auto; padding: 20px; font-family: 'Microsoft JhengHei', Arial, sans-serif;">
-    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px 10px 0 0; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-        <h2 style="margin: 0; font-size: 24px; display: flex; align-items: center;">
-            <span style="font-size: 30px; margin-right: 10px;">📊</span>
-            量價戰法分析
-        </h2>
-        <p style="margin: 5px 0 0 0; font-size: 14px; opacity: 0.9;">基於量價關係、K線型態、趨勢判斷的綜合分析</p>
-    </div>
-    
-    <div style="background: white; padding: 25px; border: 1px solid #e0e0e0; border-top: none; border-radius: 0 0 10px 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-        <!-- 核心指標卡片 -->
-        <div style="display: flex; gap: 15px; margin-bottom: 25px; flex-wrap: wrap;">
-            <!-- 操作建議卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {action_color}15, {action_color}25); border-left: 4px solid {action_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">💡 操作建議</div>
-                <div style="font-size: 28px; font-weight: bold; color: {action_color};">{analysis['action']}</div>
-            </div>
-            
-            <!-- 風險等級卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {risk_color}15, {risk_color}25); border-left: 4px solid {risk_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">⚠️ 風險等級</div>
-                <div style="font-size: 28px; font-weight: bold; color: {risk_color};">{analysis['risk_level']}</div>
-            </div>
-            
-            <!-- 評分卡 -->
-            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {progress_color}15, {progress_color}25); border-left: 4px solid {progress_color}; padding: 15px; border-radius: 8px;">
-                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">📈 綜合評分</div>
-                <div style="font-size: 28px; font-weight: bold; color: {progress_color};">{score} 分</div>
-                <div style="background: #e0e0e0; height: 8px; border-radius: 4px; margin-top: 8px; overflow: hidden;">
-                    <div style="background: {progress_color}; height: 100%; width: {progress}%; transition: width 0.3s ease;"></div>
-                </div>
-            </div>
-        </div>
-        
-        <!-- 信號列表 -->
-        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; border: 1px solid #e9ecef;">
-            <h3 style="margin: 0 0 15px 0; font-size: 18px; color: #333; display: flex; align-items: center;">
-                <span style="font-size: 22px; margin-right: 8px;">🔍</span>
-                技術信號分析
-            </h3>
-            {signals_html}
-        </div>
-        
-        <!-- 評分說明 -->
-        <div style="margin-top: 20px; padding: 15px; background: #fff3cd; border-left: 4px solid #ffc107; border-radius: 4px;">
-            <div style="font-size: 14px; color: #856404; line-height: 1.6;">
-                <strong>📖 評分標準：</strong>
-                <span style="display: inline-block; margin: 0 10px;">≥8分=重倉</span>
-                <span style="display: inline-block; margin: 0 10px;">5-7分=上車</span>
-                <span style="display: inline-block; margin: 0 10px;">-4~4分=觀望</span>
-                <span style="display: inline-block; margin: 0 10px;">-5~-7分=減倉</span>
-                <span style="display: inline-block; margin: 0 10px;">≤-8分=清倉</span>
-            </div>
-        </div>
-        
-        <!-- 免責聲明 -->
-        <div style="margin-top: 20px; padding: 12px; background: #f8f9fa; border-radius: 4px; font-size: 12px; color: #6c757d; text-align: center;">
-            ⚠️ 本分析僅供參考，不構成投資建議。股市有風險，投資需謹慎。
-        </div>
-    </div>
-</div>
-'''
+        analysis_block = ANALYSIS_BLOCK_TEMPLATE.format(
+            action=analysis['action'], action_color=action_color,
+            risk_level=analysis['risk_level'], risk_color=risk_color,
+            score=score, progress=progress, progress_color=progress_color,
+            signals_html=signals_html
+        )
         
         # 包裝完整HTML
-        viewport_meta = '<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, minimum-scale=1.0, user-scalable=no">'
-        full_html = f'''<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    {viewport_meta}
-    <title>{action} - {stock_code} {stock_name}</title>
-    <style>
-        body {{ margin: 0; padding: 0; background: #f5f5f5; }}
-    </style>
-</head>
-<body>
-{html_string}
-{analysis_block}
-</body>
-</html>'''
+        full_html = CHART_PAGE_TEMPLATE.format(
+            title=f"{action} - {stock_code} {stock_name}",
+            chart_html=html_string,
+            analysis_block=analysis_block
+        )
         
-        # 儲存檔案
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_html)
+        # 儲存檔案（一次編碼、一次寫入）
+        output_path.write_bytes(full_html.encode('utf-8'))
         
         print(f"  ✓ 圖表已生成: {output_path}")
         
@@ -727,7 +752,6 @@ def generate_stock_chart(stock_code, stock_name, csv_file, output_folder, stock_
         
     except Exception as e:
         print(f"  ❌ 生成圖表失敗: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
@@ -751,6 +775,7 @@ def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=Non
                 print(f"🗑️  已刪除舊資料庫")
         
         conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA temp_store=MEMORY")  # 暫存資料放在記憶體
         cursor = conn.cursor()
         
         # 創建表格 - 包含完整的 OHLCV 資料
@@ -778,65 +803,56 @@ def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=Non
             )
         ''')
         
-        from datetime import datetime
         update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
+        insert_sql = '''
+            INSERT OR REPLACE INTO hot_stocks 
+            (股票代碼, 股票名稱, 類型, 產業分類, 日期, 
+             開盤價, 最高價, 最低價, 收盤價, 成交量,
+             成交筆數, 成交金額, 本益比,
+             外陸資買賣超張數, 投信買賣超張數, 自營商買賣超張數,
+             更新時間, IS_FOCUS)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        
+        # 全部股票在同一個交易中寫入，最後一次 commit
         total_records = 0
         for r in results:
             code = r['code']
-            info = company_info.get(code, {})
-            name = info.get('name', '未知')
-            type_str = info.get('type', '未知')
-            sector = info.get('sector', '未知')
+            name, type_str, sector = company_info.get(code, UNKNOWN_COMPANY)
             
-            # 讀取該股票的完整歷史資料
+            # 讀取該股票的完整歷史資料（數值欄位已轉換，下方直接整欄取出）
             stock_df = read_stock_from_db(code)
             if stock_df is None or len(stock_df) == 0:
                 continue
             
-            # 確保數據類型正確
-            stock_df = stock_df.copy()
-            for col in ['開盤價', '最高價', '最低價', '收盤價', '成交張數']:
-                if col in stock_df.columns:
-                    stock_df[col] = stock_df[col].astype(str).str.replace(',', '', regex=False)
-                    stock_df[col] = pd.to_numeric(stock_df[col], errors='coerce')
+            # 整欄一次轉換日期格式為統一格式 YYYY.MM.DD（資料庫日期固定為 YYYY-MM-DD，無法解析的保留原字串）
+            date_strs = (pd.to_datetime(stock_df['日期'], format='%Y-%m-%d', errors='coerce')
+                         .dt.strftime('%Y.%m.%d')
+                         .fillna(stock_df['日期'].astype(str))
+                         .tolist())
             
-            # 將每一天的資料都寫入資料庫
-            for idx, row in stock_df.iterrows():
-                # 轉換日期格式為統一格式 YYYY.MM.DD
-                try:
-                    date_obj = pd.to_datetime(row['日期'])
-                    date_str = date_obj.strftime('%Y.%m.%d')
-                except:
-                    date_str = str(row['日期'])
-                
-                # 判斷是否為 focus 股票
-                is_focus = 1 if (focus_stock_codes and code in focus_stock_codes) else 0
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO hot_stocks 
-                    (股票代碼, 股票名稱, 類型, 產業分類, 日期, 
-                     開盤價, 最高價, 最低價, 收盤價, 成交量,
-                     成交筆數, 成交金額, 本益比,
-                     外陸資買賣超張數, 投信買賣超張數, 自營商買賣超張數,
-                     更新時間, IS_FOCUS)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    code, name, type_str, sector, date_str,
-                    float(row.get('開盤價', 0)) if not pd.isna(row.get('開盤價')) else 0,
-                    float(row.get('最高價', 0)) if not pd.isna(row.get('最高價')) else 0,
-                    float(row.get('最低價', 0)) if not pd.isna(row.get('最低價')) else 0,
-                    float(row.get('收盤價', 0)) if not pd.isna(row.get('收盤價')) else 0,
-                    int(row.get('成交張數', 0)) if not pd.isna(row.get('成交張數')) else 0,
-                    str(row.get('成交筆數', '')),
-                    str(row.get('成交金額', '')),
-                    str(row.get('本益比', '')),
-                    float(row.get('外陸資買賣超張數', 0)) if not pd.isna(row.get('外陸資買賣超張數')) else 0,
-                    float(row.get('投信買賣超張數', 0)) if not pd.isna(row.get('投信買賣超張數')) else 0,
-                    float(row.get('自營商買賣超張數', 0)) if not pd.isna(row.get('自營商買賣超張數')) else 0,
-                    update_time, is_focus
-                ))
-                total_records += 1
+            # 判斷是否為 focus 股票
+            is_focus = 1 if (focus_stock_codes and code in focus_stock_codes) else 0
+            
+            # 以整欄轉換取代逐列 iterrows，組成一批資料列再以 executemany 一次寫入
+            rows = list(zip(
+                repeat(code), repeat(name), repeat(type_str), repeat(sector), date_strs,
+                hot_db_float_values(stock_df, '開盤價'),
+                hot_db_float_values(stock_df, '最高價'),
+                hot_db_float_values(stock_df, '最低價'),
+                hot_db_float_values(stock_df, '收盤價'),
+                hot_db_int_values(stock_df, '成交張數'),
+                hot_db_text_values(stock_df, '成交筆數'),
+                hot_db_text_values(stock_df, '成交金額'),
+                hot_db_text_values(stock_df, '本益比'),
+                hot_db_float_values(stock_df, '外陸資買賣超張數'),
+                hot_db_float_values(stock_df, '投信買賣超張數'),
+                hot_db_float_values(stock_df, '自營商買賣超張數'),
+                repeat(update_time), repeat(is_focus)
+            ))
+            cursor.executemany(insert_sql, rows)
+            total_records += len(rows)
         
         conn.commit()
         conn.close()
@@ -846,7 +862,6 @@ def save_to_hot_db(results, company_info, latest_date_str, focus_stock_codes=Non
         
     except Exception as e:
         print(f"❌ 保存到資料庫失敗: {e}")
-        import traceback
         traceback.print_exc()
 
 # ==============================
@@ -858,6 +873,9 @@ def main():
     第一階段：一般模式（全股掃描）
     第二階段：追蹤清單模式（focus_stocks.csv）
     """
+    # 來源資料庫加上查詢用索引（已存在則略過）
+    ensure_indexes([DB_TSE_PATH, DB_OTC_PATH])
+    
     # 載入公司資訊
     company_info = load_company_lists()
     print(f"📋 已載入 {len(company_info)} 家公司資訊")
@@ -868,7 +886,7 @@ def main():
         print("   範例資料:")
         for code in sample_codes:
             info = company_info[code]
-            print(f"   {code}: {info['name']} ({info['type']} | {info['sector']})")
+            print(f"   {code}: {info.name} ({info.type} | {info.sector})")
     else:
         print("⚠️ 警告：未能載入任何公司資訊！")
     print()
@@ -877,19 +895,16 @@ def main():
     latest_date_str = None
     try:
         if Path(DB_TSE_PATH).exists():
-            conn = sqlite3.connect(DB_TSE_PATH)
-            cursor = conn.cursor()
+            cursor = get_db_connection(DB_TSE_PATH).cursor()
             cursor.execute("SELECT MAX(日期) FROM stock_data")
             result = cursor.fetchone()
             if result and result[0]:
                 latest_date_str = pd.to_datetime(result[0]).strftime('%Y.%m.%d')
-            conn.close()
     except:
         pass
     
     if not latest_date_str:
         print("⚠️ 無法取得最新日期，使用今日日期")
-        from datetime import datetime
         latest_date_str = datetime.now().strftime('%Y.%m.%d')
     
     print(f"📅 最新資料日期: {latest_date_str}\n")
@@ -897,6 +912,7 @@ def main():
     # 建立輸出資料夾
     base_output_folder = Path(OUTPUT_CHARTS_FOLDER)
     base_output_folder.mkdir(exist_ok=True)
+    write_plotlyjs_bundle(base_output_folder)
     
     # 建立以日期命名的子資料夾（前綴 full_）
     output_folder = base_output_folder / f"full_{latest_date_str}_Gemini"
@@ -930,36 +946,34 @@ def main():
     print(f"   • 輸出CSV: {'✅ 啟用' if OUTPUT_CSV else '❌ 關閉'}")
     print()
 
-    # 篩選符合條件的股票
+    # 一次讀入全部股票資料，之後各檔直接取用
+    all_stocks = load_all_stocks()
+    
+    # 篩選符合條件的股票（全部股票一次判斷）
     results = []
-    for stock_code in stock_codes:
-        df = read_stock_from_db(stock_code)
-        if df is None or len(df) == 0:
-            continue
-        
-        res = screen_stocks(
-            df,
-            use_price=USE_PRICE,
-            use_ma=USE_MA,
-            use_vol=USE_VOL,
-            use_min_vol=USE_MIN_VOL,
-            use_inst=USE_INST,
-            use_shape=USE_SHAPE,
-            max_price=MAX_PRICE,
-            vol_ratio_limit=VOL_RATIO_LIMIT,
-            min_volume=MIN_VOLUME,
-            shadow_limit=SHADOW_LIMIT,
-            ma_short=MA_SHORT,
-            ma_long=MA_LONG
-        )
-        
-        if res:
-            results.append({
-                'code': res['stock_code'],
-                'latest_date': res['latest_date'],
-                'latest_close': res['收盤價'],
-                'last_volume': df['成交張數'].iloc[-1] if '成交張數' in df.columns else 0
-            })
+    for stock_code, res in screen_all_stocks(
+        all_stocks,
+        stock_codes,
+        use_price=USE_PRICE,
+        use_ma=USE_MA,
+        use_vol=USE_VOL,
+        use_min_vol=USE_MIN_VOL,
+        use_inst=USE_INST,
+        use_shape=USE_SHAPE,
+        max_price=MAX_PRICE,
+        vol_ratio_limit=VOL_RATIO_LIMIT,
+        min_volume=MIN_VOLUME,
+        shadow_limit=SHADOW_LIMIT,
+        ma_short=MA_SHORT,
+        ma_long=MA_LONG
+    ):
+        df = all_stocks[stock_code]
+        results.append({
+            'code': res['stock_code'],
+            'latest_date': res['latest_date'],
+            'latest_close': res['收盤價'],
+            'last_volume': df['成交張數'].iloc[-1] if '成交張數' in df.columns else 0
+        })
 
     # 按成交量排序
     results.sort(key=lambda x: x.get('last_volume', 0), reverse=True)
@@ -970,51 +984,65 @@ def main():
         print(f"✅ 找到 {len(results)} 檔符合基本條件，將進一步篩選「上車」建議：\n")
         
         chart_count = 0
-        for r in results:
-            code = r['code']
-            
-            # 從 company_info 取得股票資訊
-            info = company_info.get(code, {})
-            name = info.get('name', '未知')
-            type_str = info.get('type', '未知')
-            sector = info.get('sector', '未知')
-            
-            # 除錯：如果是「未知」，嘗試從資料庫中讀取
-            if name == '未知':
-                print(f"    ⚠️ 在 company_info 中找不到 {code} 的資訊")
-                stock_df_temp = read_stock_from_db(code)
-                if stock_df_temp is not None and len(stock_df_temp) > 0:
-                    if '股票名稱' in stock_df_temp.columns:
-                        name = stock_df_temp['股票名稱'].iloc[0]
-                        print(f"    ✓ 從資料庫中找到名稱: {name}")
-                    else:
-                        print(f"    ⚠️ 資料庫中也沒有「股票名稱」欄位")
-                        # 顯示資料庫的所有欄位
-                        print(f"    資料庫欄位: {list(stock_df_temp.columns)}")
-
-            print(f"{code} | {name} | {type_str} | {sector} | 日期: {r['latest_date']} | 收盤: {r['latest_close']:.2f}")
-            
-            # 讀取股票資料
-            stock_df = read_stock_from_db(code)
-            if stock_df is not None and len(stock_df) >= 10:
-                # 生成圖表
-                print(f"    🎨 生成圖表...")
-                if generate_stock_chart(code, name, None, output_folder, type_str, sector):
-                    chart_count += 1
+        
+        # 先依序準備每檔的輸出並把圖表交給多個行程平行生成，之後再依原本順序輸出
+        plans = []
+        with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=init_chart_worker) as chart_pool:
+            for r in results:
+                code = r['code']
+                
+                # 圖表生成前的訊息先暫存，輪到這檔時再一併印出
+                header = io.StringIO()
+                with redirect_stdout(header):
+                    # 從 company_info 取得股票資訊
+                    name, type_str, sector = company_info.get(code, UNKNOWN_COMPANY)
+                    
+                    # 除錯：如果是「未知」，嘗試從資料庫中讀取
+                    if name == '未知':
+                        print(f"    ⚠️ 在 company_info 中找不到 {code} 的資訊")
+                        stock_df_temp = all_stocks.get(code)
+                        if stock_df_temp is not None and len(stock_df_temp) > 0:
+                            if '股票名稱' in stock_df_temp.columns:
+                                name = stock_df_temp['股票名稱'].iloc[0]
+                                print(f"    ✓ 從資料庫中找到名稱: {name}")
+                            else:
+                                print(f"    ⚠️ 資料庫中也沒有「股票名稱」欄位")
+                                # 顯示資料庫的所有欄位
+                                print(f"    資料庫欄位: {list(stock_df_temp.columns)}")
+                    
+                    print(f"{code} | {name} | {type_str} | {sector} | 日期: {r['latest_date']} | 收盤: {r['latest_close']:.2f}")
                 
-                # 輸出 CSV 檔案（依據Flag控制）
-                if OUTPUT_CSV:
-                    try:
-                        csv_path = output_folder / f"{code}_{name}.csv"
-                        stock_df_sorted = stock_df.sort_values('日期', ascending=False)
-                        stock_df_sorted.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                        print(f"    📄 輸出 CSV: {code}_{name}.csv")
-                    except Exception as e:
-                        print(f"    ⚠️  輸出 CSV 失敗: {e}")
-            else:
-                print(f"    ⚠️  資料不足，無法分析")
+                # 讀取股票資料
+                stock_df = all_stocks.get(code)
+                future = None
+                if stock_df is not None and len(stock_df) >= 10:
+                    # 生成圖表
+                    future = chart_pool.submit(generate_chart_job, generate_stock_chart,
+                                               (code, name, None, output_folder, type_str, sector, None, stock_df))
+                plans.append((code, name, header.getvalue(), stock_df, future))
             
-            print()
+            for code, name, header_text, stock_df, future in plans:
+                sys.stdout.write(header_text)
+                
+                if future is not None:
+                    print(f"    🎨 生成圖表...")
+                    if finish_chart_job(future):
+                        chart_count += 1
+                    
+                    # 輸出 CSV 檔案（依據Flag控制）
+                    if OUTPUT_CSV:
+                        try:
+                            csv_path = output_folder / f"{code}_{name}.csv"
+                            # 資料讀入時已依日期遞增排序，直接反轉即為新到舊，不必再排序一次
+                            stock_df_sorted = stock_df.iloc[::-1]
+                            stock_df_sorted.to_csv(csv_path, index=False, encoding='utf-8-sig')
+                            print(f"    📄 輸出 CSV: {code}_{name}.csv")
+                        except Exception as e:
+                            print(f"    ⚠️  輸出 CSV 失敗: {e}")
+                else:
+                    print(f"    ⚠️  資料不足，無法分析")
+                
+                print()
         
         # 保存到資料庫
         save_to_hot_db(results, company_info, latest_date_str, set(), is_first_stage=True)
@@ -0,0 +1,312 @@
+"""
+StockTrend2.py 與 StockTrend_Gemini.py 共用的函式：資料庫連線與索引、圖表版面與 HTML 輸出、平行生成圖表、寫入 stock_hot.db
+"""
+import numpy as np
+from pathlib import Path
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+from plotly.subplots import make_subplots
+import os
+import io
+import sys
+import sqlite3
+from functools import lru_cache
+from contextlib import redirect_stdout, redirect_stderr
+
+# ==============================
+# 📊 資料庫連線
+# ==============================
+# 共用的資料庫連線（每個資料庫只開啟一次，見 get_db_connection）
+DB_CONNECTIONS = {}
+
+def get_db_connection(db_path):
+    """取得資料庫的共用唯讀連線；第一次呼叫時開啟並設定適合大量讀取的 PRAGMA"""
+    conn = DB_CONNECTIONS.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+        conn.execute("PRAGMA mmap_size=268435456")   # 以記憶體映射加速掃描
+        conn.execute("PRAGMA cache_size=-200000")    # 約 200MB 頁面快取
+        conn.execute("PRAGMA temp_store=MEMORY")     # 排序等暫存資料放在記憶體
+        DB_CONNECTIONS[db_path] = conn
+    return conn
+
+def ensure_indexes(db_paths):
+    """
+    確保來源資料庫（db_paths，不存在的略過）有 (股票代碼, 日期) 索引：單檔查詢不必全表掃描，依日期排序也不必另外排序
+    只在第一次建立索引時執行 ANALYZE（會寫入來源資料庫，並印出提示）；資料庫無法寫入時印出警告後略過
+    """
+    for db_path in db_paths:
+        if not Path(db_path).exists():
+            continue
+        conn = None
+        try:
+            conn = sqlite3.connect(db_path)
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_stock_data_code_date'"
+            ).fetchone()
+            if not exists:
+                conn.execute("CREATE INDEX idx_stock_data_code_date ON stock_data(股票代碼, 日期)")
+                conn.execute("ANALYZE")
+                conn.commit()
+                print(f"🗂️  已在 {db_path} 建立查詢索引 (股票代碼, 日期)")
+        except sqlite3.Error as e:
+            print(f"⚠️ 無法在 {db_path} 建立查詢索引，將以無索引方式查詢: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+# ==============================
+# 📈 圖表共用設定與輸出
+# ==============================
+CHART_FONT_FAMILY = 'Microsoft JhengHei, Arial, sans-serif'
+CHART_TICK_DAYS = [1, 6, 11, 16, 21, 26]  # X 軸刻度：每月這幾天
+
+# 圖表頁面外框（固定不變的部分），由 generate_stock_chart 填入標題、圖表與分析區塊
+CHART_PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, minimum-scale=1.0, user-scalable=no">
+    <title>{title}</title>
+    <style>
+        body {{ margin: 0; padding: 0; background: #f5f5f5; }}
+    </style>
+</head>
+<body>
+{chart_html}
+{analysis_block}
+</body>
+</html>'''
+
+# 操作建議、風險等級對應的顏色
+ACTION_COLORS = {
+    '重倉': '#FF4444',
+    '上車': '#00C851',
+    '觀望': '#FFA500',
+    '減倉': '#FF8800',
+    '清倉': '#CC0000'
+}
+RISK_COLORS = {
+    '低': '#00C851',
+    '中': '#FFA500',
+    '高': '#FF4444'
+}
+
+# 量價分析區塊，由 generate_stock_chart 填入建議、風險、評分與信號列表
+ANALYSIS_BLOCK_TEMPLATE = '''
+<div style="max-width: 1200px; margin: 30px auto; padding: 20px; font-family: 'Microsoft JhengHei', Arial, sans-serif;">
+    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px 10px 0 0; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
+        <h2 style="margin: 0; font-size: 24px; display: flex; align-items: center;">
+            <span style="font-size: 30px; margin-right: 10px;">📊</span>
+            量價戰法分析
+        </h2>
+        <p style="margin: 5px 0 0 0; font-size: 14px; opacity: 0.9;">基於量價關係、K線型態、趨勢判斷的綜合分析</p>
+    </div>
+    
+    <div style="background: white; padding: 25px; border: 1px solid #e0e0e0; border-top: none; border-radius: 0 0 10px 10px; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
+        <!-- 核心指標卡片 -->
+        <div style="display: flex; gap: 15px; margin-bottom: 25px; flex-wrap: wrap;">
+            <!-- 操作建議卡 -->
+            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {action_color}15, {action_color}25); border-left: 4px solid {action_color}; padding: 15px; border-radius: 8px;">
+                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">💡 操作建議</div>
+                <div style="font-size: 28px; font-weight: bold; color: {action_color};">{action}</div>
+            </div>
+            
+            <!-- 風險等級卡 -->
+            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {risk_color}15, {risk_color}25); border-left: 4px solid {risk_color}; padding: 15px; border-radius: 8px;">
+                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">⚠️ 風險等級</div>
+                <div style="font-size: 28px; font-weight: bold; color: {risk_color};">{risk_level}</div>
+            </div>
+            
+            <!-- 評分卡 -->
+            <div style="flex: 1; min-width: 200px; background: linear-gradient(135deg, {progress_color}15, {progress_color}25); border-left: 4px solid {progress_color}; padding: 15px; border-radius: 8px;">
+                <div style="font-size: 12px; color: #666; margin-bottom: 5px;">📈 綜合評分</div>
+                <div style="font-size: 28px; font-weight: bold; color: {progress_color};">{score} 分</div>
+                <div style="background: #e0e0e0; height: 8px; border-radius: 4px; margin-top: 8px; overflow: hidden;">
+                    <div style="background: {progress_color}; height: 100%; width: {progress}%; transition: width 0.3s ease;"></div>
+                </div>
+            </div>
+        </div>
+        
+        <!-- 信號列表 -->
+        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; border: 1px solid #e9ecef;">
+            <h3 style="margin: 0 0 15px 0; font-size: 18px; color: #333; display: flex; align-items: center;">
+                <span style="font-size: 22px; margin-right: 8px;">🔍</span>
+                技術信號分析
+            </h3>
+            {signals_html}
+        </div>
+        
+        <!-- 評分說明 -->
+        <div style="margin-top: 20px; padding: 15px; background: #fff3cd; border-left: 4px solid #ffc107; border-radius: 4px;">
+            <div style="font-size: 14px; color: #856404; line-height: 1.6;">
+                <strong>📖 評分標準：</strong>
+                <span style="display: inline-block; margin: 0 10px;">≥8分=重倉</span>
+                <span style="display: inline-block; margin: 0 10px;">5-7分=上車</span>
+                <span style="display: inline-block; margin: 0 10px;">-4~4分=觀望</span>
+                <span style="display: inline-block; margin: 0 10px;">-5~-7分=減倉</span>
+                <span style="display: inline-block; margin: 0 10px;">≤-8分=清倉</span>
+            </div>
+        </div>
+        
+        <!-- 免責聲明 -->
+        <div style="margin-top: 20px; padding: 12px; background: #f8f9fa; border-radius: 4px; font-size: 12px; color: #6c757d; text-align: center;">
+            ⚠️ 本分析僅供參考，不構成投資建議。股市有風險，投資需謹慎。
+        </div>
+    </div>
+</div>
+'''
+
+def moving_average(values, window):
+    """
+    以 NumPy 視窗加總計算移動平均（等同 rolling(window, min_periods=1).mean()）
+    前段不足一個視窗時以 NaN 補齊；NaN 不計入平均，視窗內沒有有效值時回傳 NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    padded = np.concatenate((np.full(window - 1, np.nan), values))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+    counts = (~np.isnan(windows)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, np.nansum(windows, axis=1) / counts, np.nan)
+
+@lru_cache(maxsize=1)
+def get_chart_base_layout():
+    """
+    建立一次 4 層子圖的共用版面（子圖位置、樣板、圖例、字型、座標軸設定）並轉成 dict 快取
+    每檔股票只覆寫標題、價格範圍與 X 軸刻度；回傳的 dict 為共用快取，請勿直接修改
+    """
+    fig = make_subplots(
+        rows=4, cols=1,
+        shared_xaxes=True,
+        vertical_spacing=0.03,
+        subplot_titles=('', '', '', ''),
+        row_heights=[0.4, 0.2, 0.2, 0.2],
+        specs=[[{"secondary_y": False}],
+               [{"secondary_y": False}],
+               [{"secondary_y": False}],
+               [{"secondary_y": False}]]
+    )
+    
+    fig.update_layout(
+        xaxis_rangeslider_visible=False,
+        height=1500,
+        showlegend=True,
+        hovermode='x unified',
+        template='plotly_white',
+        barmode='relative',
+        legend=dict(
+            orientation="v",
+            yanchor="top",
+            y=0.98,
+            xanchor="left",
+            x=0.01,
+            bgcolor="rgba(255, 255, 255, 0.8)",
+            bordercolor="lightgray",
+            borderwidth=1,
+            font=dict(family=CHART_FONT_FAMILY)
+        ),
+        font=dict(family=CHART_FONT_FAMILY),
+        dragmode='pan'
+    )
+    
+    fig.update_yaxes(title_text="股價 (元)", row=1, col=1, fixedrange=True)
+    fig.update_yaxes(title_text="成交量 (張)", row=2, col=1, tickformat=",", fixedrange=True)
+    fig.update_yaxes(title_text="當日買賣超 (張)", row=3, col=1, tickformat=",", fixedrange=True)
+    fig.update_yaxes(title_text="累積買賣超 (張)", row=4, col=1, tickformat=",", fixedrange=True)
+    
+    fig.update_xaxes(
+        tickformat="%m-%d",
+        tickangle=-45,
+        tickmode='array',
+        showticklabels=True,
+        autorange=True,
+        hoverformat="%m-%d",
+        fixedrange=True
+    )
+    
+    return fig.to_plotly_json()['layout']
+
+@lru_cache(maxsize=1)
+def get_plotlyjs_loader():
+    """
+    以空白圖表各輸出一次（含/不含載入標籤），取出 plotly.js 載入標籤供之後每張圖共用
+    標籤改為引用上一層（OUTPUT_CHARTS_FOLDER）共用的 plotly.min.js（見 write_plotlyjs_bundle）
+    回傳 (插入點位於圖表 div 之前幾個字元, 載入標籤)
+    """
+    empty = dict(data=[], layout={})
+    with_js = pio.to_html(empty, include_plotlyjs='directory', div_id='plotly-div', validate=False)
+    without_js = pio.to_html(empty, include_plotlyjs=False, div_id='plotly-div', validate=False)
+    pos = len(os.path.commonprefix([with_js, without_js]))
+    loader = with_js[pos:len(with_js) - (len(without_js) - pos)]
+    loader = loader.replace('src="plotly.min.js"', 'src="../plotly.min.js"')
+    return without_js.index('<div id="plotly-div"') - pos, loader
+
+def write_plotlyjs_bundle(charts_folder):
+    """
+    在圖表根資料夾寫入一份 plotly.min.js，供底下各日期資料夾的圖表 HTML 共用
+    已存在且內容與目前安裝的 plotly 相同時略過；舊版本或寫到一半的檔案會被取代（先寫暫存檔再改名）
+    """
+    bundle_path = Path(charts_folder) / 'plotly.min.js'
+    bundle = get_plotlyjs().encode('utf-8')
+    if bundle_path.exists() and bundle_path.stat().st_size == len(bundle) and bundle_path.read_bytes() == bundle:
+        return
+    tmp_path = bundle_path.with_name(f"{bundle_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(bundle)
+    os.replace(tmp_path, bundle_path)
+
+def chart_to_html(figure):
+    """等同 pio.to_html(figure, include_plotlyjs='directory', validate=False)（但引用上一層的 plotly.min.js），載入標籤只產生一次"""
+    offset, loader = get_plotlyjs_loader()
+    html_string = pio.to_html(figure, include_plotlyjs=False, validate=False)
+    pos = html_string.index('<div id="') - offset
+    return html_string[:pos] + loader + html_string[pos:]
+
+# ==============================
+# 🧵 平行生成圖表
+# ==============================
+def init_chart_worker():
+    """子行程不可沿用父行程開啟的 SQLite 連線，清空後由 get_db_connection 重新開啟"""
+    DB_CONNECTIONS.clear()
+
+def generate_chart_job(generate_chart, args):
+    """
+    在子行程中執行 generate_chart(*args)（各程式自己的 generate_stock_chart），並收集過程中的輸出
+    回傳 (是否成功, stdout 內容, stderr 內容)，由主行程依原本順序印出
+    """
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        ok = generate_chart(*args)
+    return ok, out.getvalue(), err.getvalue()
+
+def finish_chart_job(future):
+    """等待圖表工作完成並印出其輸出，回傳是否成功"""
+    ok, out, err = future.result()
+    sys.stdout.write(out)
+    if err:
+        sys.stderr.write(err)
+    return ok
+
+# ==============================
+# 💾 stock_hot.db 寫入用的欄位轉換
+# ==============================
+def hot_db_float_values(df, col):
+    """取出數值欄位寫入 stock_hot.db 用的串列，缺值或缺欄位補 0"""
+    if col not in df.columns:
+        return [0.0] * len(df)
+    return df[col].fillna(0).to_numpy(dtype=np.float64).tolist()
+
+def hot_db_int_values(df, col):
+    """同 hot_db_float_values，但轉為整數（小數部分捨去）"""
+    if col not in df.columns:
+        return [0] * len(df)
+    return df[col].fillna(0).to_numpy(dtype=np.float64).astype(np.int64).tolist()
+
+def hot_db_text_values(df, col):
+    """取出文字欄位寫入 stock_hot.db 用的串列，缺欄位補空字串"""
+    if col not in df.columns:
+        return [''] * len(df)
+    values = df[col]
+    # 資料庫讀出的文字欄位本來就是字串，沒有缺值時直接整欄取出，不必逐格 str()
+    if values.dtype == 'str' and not values.hasnans:
+        return values.tolist()
+    return [str(v) for v in values.tolist()]
@@ -0,0 +1,113 @@
+import contextlib
+import io
+import pickle
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import StockTrend as st
+
+HEADER = '日期,股票代碼,股票名稱,成交張數,成交筆數,成交金額,開盤價,最高價,最低價,收盤價,本益比,外陸資買賣超張數,投信買賣超張數,自營商買賣超張數'
+
+
+def make_rows(n_days, seed=0):
+    """產生舊到新排序的模擬交易資料列（天數超過 TAIL_READ_LINES，才會走只讀部分檔案的路徑）"""
+    rng = np.random.default_rng(seed)
+    close = 50 + np.cumsum(rng.normal(0, 1, n_days))
+    rows = []
+    for i in range(n_days):
+        d = date(2025, 1, 1) + timedelta(days=i)
+        c = round(float(close[i]), 2)
+        foreign, fund, dealer = (int(v) for v in rng.integers(-800, 800, 3))
+        rows.append(
+            f'{d:%Y-%m-%d},9999,測試,{int(rng.integers(1000, 5000))},"1,234","56,789,000",'
+            f'{c - 0.5:.2f},{c + 1:.2f},{c - 1:.2f},{c:.2f},12.3,{foreign},{fund},{dealer}'
+        )
+    return rows
+
+
+class AnalyzeStockFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.rows = make_rows(st.TAIL_READ_LINES * 2)
+
+    def write_csv(self, name, rows):
+        path = Path(self.tmp.name) / name
+        path.write_text('﻿' + '\n'.join([HEADER] + rows) + '\n', encoding='utf-8')
+        return path
+
+    def assert_matches_full_parse(self, path):
+        full = st.load_stock_frame(path, True)
+        window = st.load_recent_frame(path)
+        self.assertTrue(window.tail(st.MIN_DATA_DAYS).equals(full.tail(st.MIN_DATA_DAYS)))
+
+        result = st.analyze_stock_file(path)
+        expected = st.analyze_stock_frame(full)
+        self.assertIsNotNone(result)
+        self.assertEqual(result, expected)
+        self.assertEqual(result['latest_date'], self.rows[-1][:10])
+
+    def test_newest_first_csv_matches_full_parse(self):
+        self.assert_matches_full_parse(self.write_csv('newest_first.csv', self.rows[::-1]))
+
+    def test_oldest_first_csv_matches_full_parse(self):
+        self.assert_matches_full_parse(self.write_csv('oldest_first.csv', self.rows))
+
+    def test_newest_first_csv_with_appended_days_matches_full_parse(self):
+        # 新到舊的匯出檔之後又在尾端追加最新幾天：首尾日期看起來像舊到新，但尾端那段並未依序排列
+        rows = self.rows[:-5][::-1] + self.rows[-5:]
+        self.assert_matches_full_parse(self.write_csv('appended.csv', rows))
+
+    def test_out_of_order_rows_match_full_parse(self):
+        rows = list(self.rows)
+        rows[-30], rows[-10] = rows[-10], rows[-30]
+        self.assert_matches_full_parse(self.write_csv('oldest_first_shuffled.csv', rows))
+        self.assert_matches_full_parse(self.write_csv('newest_first_shuffled.csv', rows[::-1]))
+
+    def test_malformed_dates_are_reported(self):
+        # 日期格式改變時應回報錯誤，而不是把資料列全部濾掉後當成「資料不足」
+        rows = [row.replace('-', '/', 2) for row in self.rows]
+        path = self.write_csv('slash_dates.csv', rows)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result, ok = st.analyze_stock_job(path)
+        self.assertIsNone(result)
+        self.assertFalse(ok)
+        self.assertIn('日期欄位含無法解析的值', output.getvalue())
+
+
+class ScanCacheTest(unittest.TestCase):
+    def test_failed_files_are_not_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp) / 'csv'
+            folder.mkdir()
+            good = folder / 'good.csv'
+            good.write_text('\n'.join([HEADER] + make_rows(st.TAIL_READ_LINES)) + '\n', encoding='utf-8')
+            bad = folder / 'bad.csv'
+            bad.write_bytes(b'\xff\xfe bad\n')
+
+            cache_file = str(Path(tmp) / 'scan_cache.pkl')
+            original = st.SCAN_CACHE_FILE
+            st.SCAN_CACHE_FILE = cache_file
+            self.addCleanup(setattr, st, 'SCAN_CACHE_FILE', original)
+            # 前面的測試已在本行程使用過 Polars，之後再 fork 子行程可能卡住；這裡只驗證快取，改用執行緒池
+            self.addCleanup(setattr, st, 'ProcessPoolExecutor', st.ProcessPoolExecutor)
+            st.ProcessPoolExecutor = ThreadPoolExecutor
+            with contextlib.redirect_stdout(io.StringIO()):
+                st.scan_stock_folder(folder)
+            with open(cache_file, 'rb') as f:
+                cache = pickle.load(f)
+
+            self.assertIn(str(good), cache)
+            self.assertNotIn(str(bad), cache)
+
+
+if __name__ == '__main__':
+    unittest.main()